@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# Startup cost of the package and the command line. Each scenario runs in a fresh
+# interpreter and writes one json object with its wall times and which of the
+# heavy dependencies it ended up importing, so a change that drags OpenCV into
+# `mtg-scan --help` shows up, e.g.
+#
+#   python benchmarks/bench_import.py --repeat 10 -o import_output.txt
+
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import click
+
+from scryfall_stub import StubScryfall
+from synthetic import CARDS
+
+_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+_heavy = ('cv2', 'numpy', 'pytesseract', 'requests', 'click')
+
+# prints the heavy modules loaded, on stderr, as the interpreter exits
+_report = (f'import atexit, json, sys; atexit.register(lambda: print(json.dumps('
+    f'[m for m in {_heavy!r} if m in sys.modules]), file=sys.stderr))')
+_cli = 'from mtg_scanner.cli import main; main()'
+
+
+def _scenarios(api_url):
+    records = ''.join(f'{title}\t{set_code}\t{collector_number}\n' for title, set_code, collector_number, *_ in CARDS)
+    scryfall = ['--api-url', api_url, '--no-cache']
+    # name, python statement, command line arguments, stdin
+    return [
+        ('python', 'pass', [], ''),
+        ('import_package', 'import mtg_scanner', [], ''),
+        ('help', _cli, ['--help'], ''),
+        ('scan_help', _cli, ['scan', '--help'], ''),
+        ('canonicalize', _cli, ['canonicalize'] + scryfall, records),
+        ('import_recognize', 'import mtg_scanner.recognize', [], ''),
+    ]
+
+
+def _run(statement, args, stdin):
+    start = time.perf_counter()
+    completed = subprocess.run([sys.executable, '-c', f'{_report}; {statement}'] + args, input=stdin,
+        capture_output=True, text=True, cwd=_root, env=dict(os.environ, PYTHONPATH=_root))
+    elapsed = time.perf_counter() - start
+    if completed.returncode != 0:
+        raise click.ClickException(f'{statement} {args} failed:\n{completed.stderr}')
+    return elapsed, json.loads(completed.stderr.strip().splitlines()[-1])
+
+
+@click.command()
+@click.option('--repeat', type=click.IntRange(min=1), default=5, show_default=True,
+        help='Interpreters to start per scenario')
+@click.option('-o', '--output', type=click.File('w'), default='-')
+def main(repeat, output):
+    with StubScryfall([card[:3] for card in CARDS]) as stub:
+        for name, statement, args, stdin in _scenarios(stub.url):
+            samples = []
+            for _ in range(repeat):
+                elapsed, loaded = _run(statement, args, stdin)
+                samples.append(elapsed * 1000)
+            samples.sort()
+            print(json.dumps(dict(stage=name, n=len(samples), mean_ms=round(statistics.fmean(samples), 3),
+                p50_ms=round(samples[len(samples) // 2], 3), min_ms=round(samples[0], 3),
+                max_ms=round(samples[-1], 3), loaded=loaded)), file=output)
+            output.flush()
+
+
+if __name__ == '__main__':
+    main()
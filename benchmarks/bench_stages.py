@@ -0,0 +1,178 @@
+#!/usr/bin/env python
+# Per-stage timings of the recognizer on synthetic cards. Writes one json object
+# per (stage, dpi, noise) so runs can be kept and compared to catch regressions
+# in the hot path, e.g.
+#
+#   python benchmarks/bench_stages.py --dpi 300 --dpi 600 -o bench_output.txt
+
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import click
+import cv2
+import numpy
+
+from mtg_scanner import card
+from mtg_scanner import fingerprint
+from mtg_scanner import glyphs
+from mtg_scanner import loader
+from mtg_scanner import scryfall
+from mtg_scanner.client import ScryfallClient
+
+from scryfall_stub import StubScryfall
+from synthetic import CARDS, render_card
+
+
+class _Timings:
+    def __init__(self):
+        self.samples = {}
+
+
+    def time(self, stage, fn, *args):
+        start = time.perf_counter()
+        result = fn(*args)
+        self.samples.setdefault(stage, []).append(time.perf_counter() - start)
+        return result
+
+
+    def summary(self, **config):
+        for stage, samples in self.samples.items():
+            ms = sorted(sample * 1000 for sample in samples)
+            yield dict(config, stage=stage, n=len(ms), mean_ms=round(statistics.fmean(ms), 3),
+                p50_ms=round(ms[len(ms) // 2], 3), p90_ms=round(ms[int(len(ms) * 0.9)], 3),
+                min_ms=round(ms[0], 3), max_ms=round(ms[-1], 3))
+
+
+def _bench_decode(timings, img, tmpdir, min_dpi):
+    for ext in ('png', 'jpg', 'ppm'):
+        fn = os.path.join(tmpdir, f'card.{ext}')
+        cv2.imwrite(fn, img)
+        timings.time(f'decode_{ext}', loader.load_card_image, fn, min_dpi)
+
+
+def _build_fingerprints(directory):
+    # clean references, about the size of Scryfall's "normal" images
+    for title, set_code, collector_number, *rest in CARDS:
+        img = render_card((title, set_code, collector_number, *rest), dpi=200)
+        cv2.imwrite(os.path.join(directory, f'{set_code}_{collector_number}_{title}.png'), img)
+    return fingerprint.FingerprintIndex.build(directory)
+
+
+def _build_glyphs(directory, ocr):
+    # footer lines of clean cards at two resolutions, labeled with what they say
+    with open(os.path.join(directory, 'labels.tsv'), 'w', encoding='utf-8') as labels:
+        for dpi in (400, 600):
+            for title, set_code, collector_number, set_size, rarity in CARDS:
+                img = render_card((title, set_code, collector_number, set_size, rarity), dpi)
+                c = card.StraightCard(img, card_type=None, save_debug_images=False, ocr=ocr)
+                for line, rect, text in (
+                        (1, card.FOOTER_LINE1_SECTION_RECT, f'{collector_number}/{set_size} {rarity}'),
+                        (2, card.FOOTER_LINE2_SECTION_RECT, f'{set_code.upper()} EN')):
+                    fn = f'{set_code}_{collector_number}_{dpi}_{line}.png'
+                    cv2.imwrite(os.path.join(directory, fn), c._extract_and_prep_line('glyphs', 140, rect, invert=True))
+                    labels.write(f'{fn}\t{text}\n')
+    return glyphs.GlyphBank.build(os.path.join(directory, 'labels.tsv'))
+
+
+def _bench_glyphs(timings, img, bank, ocr):
+    c = card.StraightCard(img, card_type=None, save_debug_images=False, ocr=ocr)
+    line1 = c._extract_and_prep_line('cnc', 140, card.FOOTER_LINE1_SECTION_RECT, invert=True)
+    line2 = c._extract_and_prep_line('set', 140, card.FOOTER_LINE2_SECTION_RECT, invert=True)
+    lines = timings.time('glyph_footer', lambda: [bank.read_line(line1), bank.read_line(line2)])
+    return card.parse_footer(*lines) if None not in lines else card.FooterInfo('', '', '')
+
+
+def _bench_recognize(timings, img, ocr):
+    c = card.StraightCard(img, card_type=None, save_debug_images=False, ocr=ocr)
+    title_img = timings.time('prep_title', c._extract_and_prep_line, 'title', 90, card.TITLE_SECTION_RECT)
+    timings.time('prep_footer', lambda: (
+        c._extract_and_prep_line('cnc', 140, card.FOOTER_LINE1_SECTION_RECT, invert=True),
+        c._extract_and_prep_line('set', 140, card.FOOTER_LINE2_SECTION_RECT, invert=True)))
+    figures = timings.time('title_contours', c._find_title_figures, title_img)
+    if len(figures) == 0 or ocr is None:
+        return '', card.FooterInfo('', '', '')
+    crop = timings.time('title_crop', c._crop_title, title_img, figures)
+    title = timings.time('ocr_title', ocr.image_to_string, crop, 7).split('\n')[0]
+    timings.time('ocr_set_code', c.read_set_code)
+    timings.time('ocr_collector_number', c.read_collector_number)
+    footer = timings.time('read_footer', c.read_footer)
+    return title, footer
+
+
+@click.command()
+@click.option('--dpi', type=int, multiple=True, default=[300, 600], show_default=True)
+@click.option('--noise', type=float, multiple=True, default=[0, 8, 16], show_default=True,
+        help='Std deviation of the gaussian noise added to each card')
+@click.option('--repeat', type=click.IntRange(min=1), default=2, show_default=True,
+        help='Times to run the synthetic card list per configuration')
+@click.option('--ocr', type=click.Choice(['auto', 'capi', 'pytesseract', 'none']), default='auto', show_default=True)
+@click.option('--latency', type=float, default=0, show_default=True,
+        help='Milliseconds the stand-in Scryfall server waits before each response')
+@click.option('-o', '--output', type=click.File('w'), default='-')
+def main(dpi, noise, repeat, ocr, latency, output):
+    engine = None if ocr == 'none' else card.get_ocr_engine(ocr)
+    stub_cards = [(title, set_code, collector_number) for title, set_code, collector_number, *_ in CARDS]
+
+    with StubScryfall(stub_cards, latency=latency / 1000) as stub, tempfile.TemporaryDirectory() as tmpdir:
+        scryfall.set_api_base(stub.url)
+        scryfall.set_client(ScryfallClient(rate=1000, burst=1000))
+        references = os.path.join(tmpdir, 'references')
+        os.mkdir(references)
+        index = _build_fingerprints(references)
+        glyph_samples = os.path.join(tmpdir, 'glyphs')
+        os.mkdir(glyph_samples)
+        bank = _build_glyphs(glyph_samples, engine)
+        for d in dpi:
+            for n in noise:
+                rng = numpy.random.default_rng(0)
+                timings = _Timings()
+                records = []
+                truths = []
+                correct_titles = correct_footers = fingerprinted = glyph_footers = 0
+                for _ in range(repeat):
+                    for truth in CARDS:
+                        img = render_card(truth, d, n, rng)
+                        _bench_decode(timings, img, tmpdir, loader.DEFAULT_MIN_DPI)
+                        match = timings.time('fingerprint', index.identify, img)
+                        fingerprinted += match is not None and (match.set_code, match.collector_number) == truth[1:3]
+                        glyph_footer = _bench_glyphs(timings, img, bank, engine)
+                        glyph_footers += glyph_footer.set_code.casefold() == truth[1] and \
+                            glyph_footer.collector_number.split('/')[0] == truth[2]
+                        title, footer = _bench_recognize(timings, img, engine)
+                        correct_titles += title == truth[0]
+                        correct_footers += footer.set_code.casefold() == truth[1] and \
+                            footer.collector_number.split('/')[0] == truth[2]
+                        records.append((title, footer.set_code, footer.collector_number))
+                        truths.append(f'{truth[0]} ({truth[1]}) {truth[2]}')
+
+                if engine is not None:
+                    requests_before = stub.requests
+                    for record in records:
+                        timings.time('canonicalize', scryfall.canonicalizeCard, *record)
+                    single_requests = stub.requests - requests_before
+                    requests_before = stub.requests
+                    results = timings.time('canonicalize_batch', scryfall.canonicalize_batch, records)
+                    batch_requests = stub.requests - requests_before
+
+                config = dict(dpi=d, noise=n)
+                for line in timings.summary(**config):
+                    print(json.dumps(line), file=output)
+                summary = dict(config, stage='accuracy', cards=len(records),
+                    title_exact=correct_titles / len(records), footer_exact=correct_footers / len(records),
+                    fingerprint_exact=fingerprinted / len(records), glyph_footer_exact=glyph_footers / len(records))
+                if engine is not None:
+                    correct_cards = sum(cs == truth for (_, cs), truth in zip(results, truths))
+                    summary.update(canonical_exact=correct_cards / len(records),
+                        canonicalize_requests=single_requests, canonicalize_batch_requests=batch_requests)
+                print(json.dumps(summary), file=output)
+                output.flush()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+import difflib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, quote_plus, urlparse
+
+
+class StubScryfall:
+    # a local stand-in for the parts of api.scryfall.com that mtg_scanner.scryfall
+    # uses, serving a fixed list of (name, set, collector_number) cards with an
+    # optional per-request delay to play the part of the network. failures is a
+    # list of (status, headers) the next requests are answered with instead, e.g.
+    # (429, {'Retry-After': '1'}), and connections the client addresses seen.
+    def __init__(self, cards, latency=0.0):
+        self.cards = [{"name": name, "set": set_code, "collector_number": collector_number}
+            for name, set_code, collector_number in cards]
+        self.latency = latency
+        self.requests = 0
+        self.failures = []
+        self.connections = set()
+        self._lock = threading.Lock()
+        self.server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler())
+        self.url = f'http://127.0.0.1:{self.server.server_port}'
+        for card in self.cards:
+            card["prints_search_uri"] = f'{self.url}/cards/search?q={quote_plus(card["name"])}'
+        # a short poll so shutting down doesn't hold up each test for half a second
+        self.thread = threading.Thread(target=self.server.serve_forever, kwargs={'poll_interval': 0.05},
+            daemon=True)
+
+
+    def __enter__(self):
+        self.thread.start()
+        return self
+
+
+    def __exit__(self, *exc):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+    def _find(self, set_code, collector_number):
+        for card in self.cards:
+            if card["set"] == set_code.casefold() and card["collector_number"] == collector_number:
+                return card
+        return None
+
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # keep-alive, like the real api, so the client's pooled connections are reused
+            protocol_version = 'HTTP/1.1'
+            disable_nagle_algorithm = True
+
+            def _reply(self, status, obj, headers=None):
+                with stub._lock:
+                    stub.requests += 1
+                    stub.connections.add(self.client_address)
+                if stub.latency:
+                    time.sleep(stub.latency)
+                body = json.dumps(obj).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+
+            def _failure(self):
+                # answers with the next injected failure, False when there's none left
+                with stub._lock:
+                    if not stub.failures:
+                        return False
+                    status, headers = stub.failures.pop(0)
+                self._reply(status, {"object": "error", "status": status}, headers)
+                return True
+
+
+            def do_GET(self):
+                if self._failure():
+                    return
+                url = urlparse(self.path)
+                query = parse_qs(url.query)
+                parts = url.path.strip('/').split('/')
+                if url.path == '/cards/named':
+                    names = [card["name"] for card in stub.cards]
+                    match = difflib.get_close_matches(query.get('fuzzy', [''])[0], names, n=1, cutoff=0.5)
+                    card = next((card for card in stub.cards if match and card["name"] == match[0]), None)
+                    return self._reply(200, card) if card else self._reply(404, {"object": "error"})
+                if url.path == '/cards/search':
+                    name = query.get('q', [''])[0]
+                    return self._reply(200, {"data": [card for card in stub.cards if card["name"] == name]})
+                if len(parts) == 3 and parts[0] == 'cards':
+                    card = stub._find(parts[1], parts[2])
+                    return self._reply(200, card) if card else self._reply(404, {"object": "error"})
+                self._reply(404, {"object": "error"})
+
+
+            def do_POST(self):
+                body = self.rfile.read(int(self.headers['Content-Length']))
+                if self._failure():
+                    return
+                if self.path != '/cards/collection':
+                    return self._reply(404, {"object": "error"})
+                identifiers = json.loads(body)["identifiers"]
+                data, not_found = [], []
+                for identifier in identifiers:
+                    card = stub._find(identifier["set"], identifier["collector_number"])
+                    if card:
+                        data.append(card)
+                    else:
+                        not_found.append(identifier)
+                self._reply(200, {"data": data, "not_found": not_found})
+
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
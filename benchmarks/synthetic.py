@@ -0,0 +1,60 @@
+import zlib
+
+import cv2
+import numpy
+
+# (title, set, collector number, printed set size, rarity) for the synthetic cards
+CARDS = [
+    ("Muldrotha, the Gravetide", "dom", "199", "269", "M"),
+    ("Llanowar Elves", "dom", "168", "269", "C"),
+    ("Shivan Dragon", "m10", "156", "249", "R"),
+    ("Birds of Paradise", "m12", "165", "249", "R"),
+    ("Dark Ritual", "a25", "82", "249", "C"),
+    ("Lightning Bolt", "m11", "149", "249", "C"),
+    ("Counterspell", "a25", "50", "249", "C"),
+    ("Serra Angel", "dom", "33", "269", "U"),
+    ("Giant Growth", "m12", "172", "249", "C"),
+    ("Jace, the Mind Sculptor", "a25", "62", "249", "M"),
+    ("Wrath of God", "m10", "41", "249", "R"),
+    ("Opt", "dom", "60", "269", "C"),
+]
+
+_mm_card_width = 63
+_mm_card_height = 88
+
+
+def _mm(value, px_per_mm):
+    return int(round(value * px_per_mm))
+
+
+def render_art(title, size=(256, 192)):
+    # smooth random blobs, the same for every render of a title
+    rng = numpy.random.default_rng(zlib.crc32(title.encode('utf-8')))
+    art = rng.integers(0, 256, (6, 8, 3)).astype(numpy.uint8)
+    return cv2.resize(art, size, interpolation=cv2.INTER_CUBIC)
+
+
+def render_card(card, dpi=600, noise=0, rng=None):
+    # a plain black bordered card with a light title bar, art box and the two white
+    # footer lines, laid out to match the mm rects StraightCard reads
+    title, set_code, collector_number, set_size, rarity = card
+    px_per_mm = dpi / 25.4
+    img = numpy.full((_mm(_mm_card_height, px_per_mm), _mm(_mm_card_width, px_per_mm), 3), 25, numpy.uint8)
+    top, bottom, left, right = _mm(11, px_per_mm), _mm(49, px_per_mm), _mm(4.5, px_per_mm), _mm(58.5, px_per_mm)
+    img[top:bottom, left:right] = render_art(title, (right - left, bottom - top))
+    cv2.rectangle(img, (_mm(2, px_per_mm), _mm(3.5, px_per_mm)), (_mm(61, px_per_mm), _mm(10.5, px_per_mm)),
+        (205, 220, 228), -1)
+    cv2.putText(img, title, (_mm(4.4, px_per_mm), _mm(8.6, px_per_mm)), cv2.FONT_HERSHEY_DUPLEX,
+        px_per_mm * 0.105, (10, 10, 10), max(1, _mm(0.13, px_per_mm)), cv2.LINE_AA)
+
+    footer_scale = px_per_mm * 0.021
+    footer_thickness = max(1, _mm(0.08, px_per_mm))
+    cv2.putText(img, f'{collector_number}/{set_size} {rarity}', (_mm(3.1, px_per_mm), _mm(83.7, px_per_mm)),
+        cv2.FONT_HERSHEY_SIMPLEX, footer_scale, (240, 240, 240), footer_thickness, cv2.LINE_AA)
+    cv2.putText(img, f'{set_code.upper()} EN', (_mm(3.1, px_per_mm), _mm(85.7, px_per_mm)),
+        cv2.FONT_HERSHEY_SIMPLEX, footer_scale, (240, 240, 240), footer_thickness, cv2.LINE_AA)
+
+    if noise:
+        rng = rng if rng is not None else numpy.random.default_rng(0)
+        img = numpy.clip(img + rng.normal(0, noise, img.shape), 0, 255).astype(numpy.uint8)
+    return img
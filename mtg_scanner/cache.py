@@ -0,0 +1,158 @@
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+from mtg_scanner import profiling
+
+_default_ttl = 7 * 24 * 60 * 60          # seconds before a cached response is revalidated
+_default_max_bytes = 256 * 1024 * 1024   # evict least recently used responses beyond this
+_evict_interval = 100                    # check the size limit every n stores
+
+
+def user_cache_dir():
+    if sys.platform.startswith('win'):
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~\\AppData\\Local')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME') or os.path.expanduser('~/.cache')
+    return os.path.join(base, 'mtg-scanner')
+
+
+class ResponseCache:
+    def __init__(self, fn=None, ttl=_default_ttl, max_bytes=_default_max_bytes):
+        if fn is None:
+            os.makedirs(user_cache_dir(), exist_ok=True)
+            fn = os.path.join(user_cache_dir(), 'scryfall.sqlite')
+        self.fn = fn
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._stores = 0
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(fn, timeout=30, check_same_thread=False)
+        self._db.execute('''CREATE TABLE IF NOT EXISTS responses (
+            url TEXT PRIMARY KEY,
+            status INTEGER,
+            body BLOB,
+            size INTEGER,
+            etag TEXT,
+            last_modified TEXT,
+            fetched_at REAL,
+            accessed_at REAL)''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS responses_accessed ON responses (accessed_at)')
+        self._db.commit()
+
+
+    def close(self):
+        with self._lock:
+            self._db.close()
+
+
+    def stats(self):
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "revalidated": self.revalidated}
+
+
+    def _count(self, name):
+        # the http workers share the cache, so the counters are bumped under the lock
+        with self._lock:
+            setattr(self, name, getattr(self, name) + 1)
+        profiling.incr(f'cache_{name}')
+
+
+    def _lookup(self, url):
+        with self._lock:
+            return self._db.execute(
+                'SELECT status, body, etag, last_modified, fetched_at FROM responses WHERE url = ?',
+                (url,)).fetchone()
+
+
+    def _touch(self, url, now, fetched=False):
+        with self._lock:
+            if fetched:
+                self._db.execute('UPDATE responses SET accessed_at = ?, fetched_at = ? WHERE url = ?',
+                    (now, now, url))
+            else:
+                self._db.execute('UPDATE responses SET accessed_at = ? WHERE url = ?', (now, url))
+            self._db.commit()
+
+
+    def _store(self, url, status, body, etag, last_modified, now):
+        with self._lock:
+            self._db.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (url, status, body, len(body), etag, last_modified, now, now))
+            self._db.commit()
+            self._stores += 1
+            if self._stores % _evict_interval == 0:
+                self._evict()
+
+
+    def _evict(self):
+        # caller holds the lock
+        total = self._db.execute('SELECT COALESCE(SUM(size), 0) FROM responses').fetchone()[0]
+        if total <= self.max_bytes:
+            return
+        evicted = 0
+        for url, size in self._db.execute('SELECT url, size FROM responses ORDER BY accessed_at').fetchall():
+            if total <= self.max_bytes:
+                break
+            self._db.execute('DELETE FROM responses WHERE url = ?', (url,))
+            total -= size
+            evicted += 1
+        self._db.commit()
+        logging.info(f'response cache evicted {evicted} entries')
+
+
+    def peek(self, url):
+        # (status, body) if there is a fresh entry for url, never fetches
+        now = time.time()
+        row = self._lookup(url)
+        if row is None or now - row[4] >= self.ttl:
+            return None
+        self._count('hits')
+        self._touch(url, now)
+        return row[0], row[1]
+
+
+    def put(self, url, body, status=200):
+        # store a response for url obtained some other way (e.g. a batch call)
+        self._store(url, status, body, None, None, time.time())
+
+
+    def get(self, url, fetch):
+        # returns (status, body) for url, calling fetch(url, headers) only when the
+        # cached copy is missing or stale. Stale copies are revalidated with the
+        # validators Scryfall handed out so an unchanged card costs a 304.
+        now = time.time()
+        row = self._lookup(url)
+        if row is not None:
+            status, body, etag, last_modified, fetched_at = row
+            if now - fetched_at < self.ttl:
+                self._count('hits')
+                self._touch(url, now)
+                return status, body
+
+        headers = {}
+        if row is not None:
+            if etag:
+                headers['If-None-Match'] = etag
+            if last_modified:
+                headers['If-Modified-Since'] = last_modified
+        response = fetch(url, headers)
+        if row is not None and response.status_code == 304:
+            self._count('revalidated')
+            self._touch(url, now, fetched=True)
+            return status, body
+
+        self._count('misses')
+        # 404s are cached too, a misread title fails the same way every time
+        if response.status_code in (200, 404):
+            self._store(url, response.status_code, response.content, response.headers.get('ETag'),
+                response.headers.get('Last-Modified'), now)
+        return response.status_code, response.content
@@ -1,15 +1,21 @@
+import atexit
 import numpy
 import cv2
+import ctypes
+import ctypes.util
 import pytesseract
 import logging
+import re
+import threading
+from collections import namedtuple
 
-# we're expecting a 88mm x 63mm card in the correct orientation
-_mm_card_height = 88
+from mtg_scanner import localize
+from mtg_scanner import profiling
 
 # section rectangles are specified in mm
-_title_section_rect = (2.5, 4, 45, 6)
-_footer_line1_section_rect = (3, 82, 10, 2)
-_footer_line2_section_rect = (3, 84, 4.2, 2)
+TITLE_SECTION_RECT = (2.5, 4, 45, 6)
+FOOTER_LINE1_SECTION_RECT = (3, 82, 10, 2)
+FOOTER_LINE2_SECTION_RECT = (3, 84, 4.2, 2)
 
 _px_working_line_height = 185
 
@@ -17,6 +23,188 @@ _px_working_line_height = 185
 _title_left_margin = 45
 _title_height = 77
 
+# white border kept around the letters when the title is cropped tight, tesseract
+# reads poorly when the glyphs touch the edge of the image
+_title_crop_margin = 4
+
+# thresholds read_title_cascade tries in turn, the one that suits most scans first
+_title_thresholds = (90, 70, 120, 50, 150)
+# mean tesseract word confidence (0-100) at which a title read is taken as is
+_title_confident_read = 85
+
+# version of how lines are prepped and read (crops, thresholds, cascade), part of
+# the OCR cache key so a change here doesn't serve reads made the old way
+READ_VERSION = 2
+
+# blank rows between the two footer lines when they are composed into one image
+_footer_line_gap = 40
+
+# collector line is e.g. "123/280 R" or "0123 C" (rarity sometimes runs into the number)
+_collector_line_re = re.compile(r'(\d{1,4}(?:/\d{1,4})?)\s*([CURMSLT])?\b')
+# set line is e.g. "DMU • EN", the set code comes first
+_set_line_re = re.compile(r'[A-Za-z0-9]{2,5}')
+# language codes that follow the set code and often get read as part of it
+_footer_languages = ('EN', 'DE', 'FR', 'IT', 'ES', 'PT', 'JP', 'KO', 'RU', 'CS', 'CT', 'PH')
+
+FooterInfo = namedtuple('FooterInfo', ['set_code', 'collector_number', 'rarity'])
+
+
+def parse_footer(line1, line2):
+    match = _collector_line_re.search(line1)
+    collector_number = match.group(1) if match else ''
+    rarity = match.group(2) if match and match.group(2) else ''
+    match = _set_line_re.search(line2)
+    set_code = match.group(0) if match else ''
+    if len(set_code) > 3 and set_code[-2:].upper() in _footer_languages:
+        set_code = set_code[:-2]
+    return FooterInfo(set_code, collector_number, rarity)
+
+
+# shared objects that might hold tesseract's C API, newest first
+_tesseract_lib_names = ['libtesseract.so.5', 'libtesseract.so.4', 'libtesseract.5.dylib',
+    'libtesseract.dylib', 'libtesseract-5.dll', 'libtesseract-4.dll']
+
+
+class PytesseractEngine:
+    # runs the tesseract executable once per call via pytesseract
+    name = 'pytesseract'
+
+    def image_to_string(self, img, psm=7):
+        profiling.incr('tesseract_calls')
+        with profiling.stage('tesseract'):
+            return pytesseract.image_to_string(img, config=f'--psm {psm}')
+
+
+    def image_to_string_with_confidence(self, img, psm=7):
+        # (text, mean word confidence 0-100), words only so no line breaks
+        profiling.incr('tesseract_calls')
+        with profiling.stage('tesseract'):
+            data = pytesseract.image_to_data(img, config=f'--psm {psm}', output_type=pytesseract.Output.DICT)
+        words = [(word, float(conf)) for word, conf in zip(data['text'], data['conf'])
+            if word.strip() and float(conf) >= 0]
+        if not words:
+            return '', 0
+        return ' '.join(word for word, conf in words), sum(conf for word, conf in words) / len(words)
+
+
+class TesseractCApiEngine:
+    # keeps one tesseract instance (and its language model) loaded for the life of
+    # the process and hands it numpy buffers directly, no fork and no temp files
+    name = 'capi'
+
+    def __init__(self, lang='eng', datapath=None):
+        self._lib = self._load_library()
+        self._lock = threading.Lock()
+        lib = self._lib
+        lib.TessBaseAPICreate.restype = ctypes.c_void_p
+        lib.TessBaseAPIInit3.argtypes = [ctypes.c_void_p, ctypes.c_char_p, ctypes.c_char_p]
+        lib.TessBaseAPISetPageSegMode.argtypes = [ctypes.c_void_p, ctypes.c_int]
+        lib.TessBaseAPISetImage.argtypes = [ctypes.c_void_p, ctypes.c_void_p, ctypes.c_int,
+            ctypes.c_int, ctypes.c_int, ctypes.c_int]
+        lib.TessBaseAPIGetUTF8Text.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIGetUTF8Text.restype = ctypes.c_void_p
+        lib.TessBaseAPIMeanTextConf.argtypes = [ctypes.c_void_p]
+        lib.TessDeleteText.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIClear.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIEnd.argtypes = [ctypes.c_void_p]
+        lib.TessBaseAPIDelete.argtypes = [ctypes.c_void_p]
+
+        self._api = lib.TessBaseAPICreate()
+        if lib.TessBaseAPIInit3(self._api, datapath.encode() if datapath else None, lang.encode()) != 0:
+            lib.TessBaseAPIDelete(self._api)
+            self._api = None
+            raise RuntimeError(f'Unable to initialize tesseract for language <{lang}>')
+        atexit.register(self.close)
+
+
+    @staticmethod
+    def _load_library():
+        names = _tesseract_lib_names
+        found = ctypes.util.find_library('tesseract')
+        if found:
+            names = [found] + names
+        for name in names:
+            try:
+                return ctypes.CDLL(name)
+            except OSError:
+                pass
+        raise OSError('Unable to find the tesseract shared library')
+
+
+    def image_to_string(self, img, psm=7):
+        return self.image_to_string_with_confidence(img, psm)[0]
+
+
+    def image_to_string_with_confidence(self, img, psm=7):
+        # (text, mean word confidence 0-100)
+        if len(img.shape) == 3:
+            img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        if img.strides[1] != 1:
+            img = numpy.ascontiguousarray(img)
+        # rows of a bigger image are fine as they are, tesseract is given the row stride
+        h, w = img.shape
+        profiling.incr('tesseract_calls')
+        with profiling.stage('tesseract'), self._lock:
+            self._lib.TessBaseAPISetPageSegMode(self._api, psm)
+            self._lib.TessBaseAPISetImage(self._api, img.ctypes.data, w, h, 1, img.strides[0])
+            text_ptr = self._lib.TessBaseAPIGetUTF8Text(self._api)
+            if not text_ptr:
+                return '', 0
+            text = ctypes.string_at(text_ptr).decode('utf-8')
+            self._lib.TessDeleteText(text_ptr)
+            confidence = self._lib.TessBaseAPIMeanTextConf(self._api)
+            self._lib.TessBaseAPIClear(self._api)
+        return text, confidence
+
+
+    def close(self):
+        with self._lock:
+            if self._api is not None:
+                self._lib.TessBaseAPIEnd(self._api)
+                self._lib.TessBaseAPIDelete(self._api)
+                self._api = None
+
+
+# one engine of each kind per process (each --jobs worker gets its own)
+_ocr_engines = {}
+
+
+class _PrepBuffers(threading.local):
+    # the working images of line prep, kept from card to card by (line, step) so a
+    # batch of scans the same size allocates them once instead of for every card.
+    # What a step returns is only good until the same line is prepped again.
+    def __init__(self):
+        self.buffers = {}
+
+
+    def get(self, line_name, step, shape):
+        buffer = self.buffers.get((line_name, step))
+        if buffer is None or buffer.shape != shape:
+            buffer = self.buffers[(line_name, step)] = numpy.empty(shape, numpy.uint8)
+        return buffer
+
+
+_prep_buffers = _PrepBuffers()
+
+
+def get_ocr_engine(name='auto'):
+    if name in _ocr_engines:
+        return _ocr_engines[name]
+    if name == 'auto':
+        try:
+            engine = get_ocr_engine('capi')
+        except (OSError, RuntimeError) as e:
+            logging.info(f'tesseract C API unavailable ({e}), using pytesseract')
+            engine = get_ocr_engine('pytesseract')
+    elif name == 'capi':
+        engine = TesseractCApiEngine()
+    elif name == 'pytesseract':
+        engine = PytesseractEngine()
+    else:
+        raise ValueError(f'Unknown OCR engine <{name}>')
+    _ocr_engines[name] = engine
+    return engine
+
 
 class _StraightLine(object):
     def __init__(self, point, slope):
@@ -45,172 +233,130 @@ class _TitleArea:
         return mm * self.px_per_mm
 
 
-class _TitleFigureArea:
-    def __init__(self, title_area, contour):
+class _TitleFigureTable:
+    # the figures (contours) found in the title line as columns of a table, so the
+    # noise heuristics below run as numpy masks over every figure at once
+    def __init__(self, title_area, contours, hulls=None, boxes=None):
         self.title_area = title_area
-        self.outer_contour = cv2.convexHull(contour)
-        self.tight_contour = contour
-        self.box = cv2.minAreaRect(contour)
+        self.contours = list(contours)
+        self.hulls = hulls if hulls is not None else [cv2.convexHull(contour) for contour in self.contours]
+        if boxes is None:
+            # RotatedRect ((center.x, center.y), (size.width, size.height), angle)
+            boxes = numpy.array([(x, y, w, h, angle) for ((x, y), (w, h), angle) in
+                map(cv2.minAreaRect, self.contours)], dtype=numpy.float64).reshape(-1, 5)
+        self.boxes = boxes
+        self.x, self.y, self.w, self.h, self.angle = boxes.T
         # FUTURE there's a bunch of nonsense in the heuristics relating to the fact
         # that the height and width of that minAreaRect aren't normalized to be
         # width along x-axis (ish) and height along y-axis (ish), probably
         # should normalize here and fix all the heuristics
 
-    def __eq__(self, other):
-        # if the outer contour is the same, close enough to not want to consider
-        # separately
-        if len(self.outer_contour) != len(other.outer_contour):
-            return False
 
-        for i in range(0, len(self.outer_contour)):
-            if (self.outer_contour[i][0] != other.outer_contour[i][0]).any():
-                return False
+    def __len__(self):
+        return len(self.contours)
+
+
+    def take(self, indexes):
+        return _TitleFigureTable(self.title_area, [self.contours[i] for i in indexes],
+            [self.hulls[i] for i in indexes], self.boxes[indexes])
 
-        return True
 
-    
     def px_from_mm(self, mm):
         return self.title_area.px_from_mm(mm)
 
 
+    def _mid_line_y(self, x):
+        # vectorized _StraightLine.get_y, truncating toward zero like int()
+        mid_line = self.title_area.mid_line
+        return numpy.trunc(mid_line.m * x + mid_line.b)
+
+
+    # from CardReaderLibrary which says it is sorting by the left border, but this code ignores the rotation angle
+    # so it appears to either assume consistency from minAreaRect or doesn't care about the sort being that precise
+    def sort_key(self):
+        return self.x - numpy.minimum(self.w, self.h)
+
+
     def is_outside_title_area(self):
-        ((x, y), (w, h), angle) = self.box
-        x_approx = int(x - w / 2)
-        y_mid_line = self.title_area.mid_line.get_y(x_approx)
-        return x_approx < _title_left_margin or abs(y - y_mid_line) > _title_height / 2
+        x_approx = numpy.trunc(self.x - self.w / 2)
+        y_mid_line = self._mid_line_y(x_approx)
+        return (x_approx < _title_left_margin) | (numpy.abs(self.y - y_mid_line) > _title_height / 2)
 
 
     def is_i_dot(self):
         i_dot_height_max = self.px_from_mm(0.6)
         i_dot_height_min = self.px_from_mm(0.3)
+        w, h, angle = self.w, self.h, self.angle
 
-        w, h = self.box[1]
-        angle = self.box[2]
-
-        return (h < i_dot_height_max and w < i_dot_height_max and h > i_dot_height_min and w > i_dot_height_min and \
-            angle < -50 and angle > -40)
+        return (h < i_dot_height_max) & (w < i_dot_height_max) & (h > i_dot_height_min) & \
+            (w > i_dot_height_min) & (angle < -50) & (angle > -40)
 
 
     def is_comma(self):
-        ((x, y), (w, h), angle) = self.box
-        if x < self.title_area.mid_line.get_y(x):
-            return False
-
-        h = max(w, h)
-        return h < self.px_from_mm(1) and h > self.px_from_mm(0.2)
+        h = numpy.maximum(self.w, self.h)
+        return ~(self.x < self._mid_line_y(self.x)) & \
+            (h < self.px_from_mm(1)) & (h > self.px_from_mm(0.2))
 
 
     def is_dot_like(self):
-        return self.is_i_dot() or self.is_comma()
+        return self.is_i_dot() | self.is_comma()
 
 
     def is_dash(self):
-        ((x, y), (w, h), angle) = self.box
-
         # is it in the middleish
-        y_mid = self.title_area.mid_line.get_y(x)
-        if y < y_mid - _title_height / 5 or y > y_mid + _title_height / 5:
-            return False
+        y_mid = self._mid_line_y(self.x)
+        middle = ~((self.y < y_mid - _title_height / 5) | (self.y > y_mid + _title_height / 5))
 
-        if angle < -45:
-            w, h = h, w
+        swap = self.angle < -45
+        w = numpy.where(swap, self.h, self.w)
+        h = numpy.where(swap, self.w, self.h)
 
         # is it the shape of a dash
-        if w == 0:
-            return True
-        aspect_ratio = h / w
-        if aspect_ratio > 0.35 or aspect_ratio < 0.2:
-            return False
+        aspect_ratio = numpy.divide(h, w, out=numpy.zeros_like(h), where=w != 0)
+        dash_shaped = ~((aspect_ratio > 0.35) | (aspect_ratio < 0.2))
 
         # is it the size-ish of a dash
-        return h > self.px_from_mm(0.5) and h < self.px_from_mm(2) and \
-            w > self.px_from_mm(0.5) and w < self.px_from_mm(2.5)
+        dash_sized = (h > self.px_from_mm(0.5)) & (h < self.px_from_mm(2)) & \
+            (w > self.px_from_mm(0.5)) & (w < self.px_from_mm(2.5))
+        return middle & ((w == 0) | (dash_shaped & dash_sized))
 
 
     def is_letter_sized(self):
-        ((x, y), (w, h), angle) = self.box
-        if w > h:
-            w, h = h, w
-
-        is_letter_sized = w > self.px_from_mm(0.1) and w < self.px_from_mm(4) and \
-            h > self.px_from_mm(1.5) and h < self.px_from_mm(4)
-        return is_letter_sized
-
-
-    def is_noise(self):
-        ((_, _), (w, h), _) = self.box
-        if w > h:
-            w, h = h, w
-
-#        if (h > self.px_from_mm(2)):
-#            logging.info(f'{self.is_dot_like()}, {self.is_dash()}, {self.is_letter_sized()}, {self.is_outside_title_area()}')
+        w = numpy.minimum(self.w, self.h)
+        h = numpy.maximum(self.w, self.h)
+        return (w > self.px_from_mm(0.1)) & (w < self.px_from_mm(4)) & \
+            (h > self.px_from_mm(1.5)) & (h < self.px_from_mm(4))
 
-        return self.is_dot_like() or self.is_dash() or \
-                not self.is_letter_sized() or self.is_outside_title_area()
 
+    def noise_masks(self):
+        # (name, mask) for each of the noise heuristics, in the order they're applied
+        return [('dot_like', self.is_dot_like()), ('dash', self.is_dash()),
+            ('not_letter_sized', ~self.is_letter_sized()), ('outside_title_area', self.is_outside_title_area())]
 
-    def is_contained_within(self, figure):
-        # seems like this should be intersection of self and figure equivalent to self?
-        # this approx logic is from CardReaderLibrary, perhaps the intersection method
-        # is too slow?
-
-        # if this center is outside the figure's convex hull then definitely not contained
-        if cv2.pointPolygonTest(figure.outer_contour, self.box[0], False) <= 0:
-            return False
-
-        # if this center is inside and the area is smaller, good enough to discard
-        return cv2.contourArea(self.outer_contour) < cv2.contourArea(figure.outer_contour)
-
-
-    # if self is entirely contained in one of the other figures (except itself)
-    # then we can throw it out
-    def is_letter_hole(self, figures):
-        # print("self is figure", list(map(lambda figure: self is figure, figures)))
-        # return any(map(lambda figure: not self is figure and self.isContainedWithin(figure), figures))
-        for figure in figures:
-            if self.is_contained_within(figure):
-                return True
-        return False
-
-
-def remove_dups_from_sorted(in_list):
-    out_list = []
-
-    if len(in_list) == 0:
-        return out_list
-
-    out_list.append(in_list[0])
-
-    for item in in_list[1:]:
-        if item != out_list[-1]:
-            out_list.append(item)
-        else:
-            logging.info(f'skip item: {item.outer_contour}, out_list[-1]: {out_list[-1].outer_contour}')
-
-    return out_list
-
-
-# from CardReaderLibrary which says it is sorting by the left border, but this code ignores the rotation angle
-# so it appears to either assume consistency from minAreaRect or doesn't care about the sort being that precise
-def _FigureAreaSort(area):
-    # RotatedRect ((center.x, center.y), (size.width, size.height), angle)
-    return area.box[0][0] - min(area.box[1][0], area.box[1][1])
 
+    def is_noise(self):
+        return numpy.logical_or.reduce([mask for name, mask in self.noise_masks()])
 
 
 class StraightCard:
-    def __init__(self, image, card_type, save_debug_images):
+    def __init__(self, image, card_type, save_debug_images, ocr=None, ocr_cache=None, frame=None,
+            debug_images=None, glyphs=None):
         self.image = image
+        # a localize.CardFrame for where the card is in image, by default it fills it
+        self.frame = frame if frame is not None else localize.CardFrame(image)
         self.card_type = card_type
-        self.save_debug_images = save_debug_images
+        # a debugsink.CardImages takes the debug images instead of the current directory
+        self.debug_images = debug_images
+        self.save_debug_images = save_debug_images or debug_images is not None
+        self.ocr = ocr if ocr is not None else get_ocr_engine()
+        # an ocrcache.OcrCache for self.ocr's results, looked up before reading a line
+        self.ocr_cache = ocr_cache
+        # a glyphs.GlyphBank to read the footer with before falling back to self.ocr
+        self.glyphs = glyphs
 
 
     def _px_rect_from_mm(self, rect):
-        (x, y, w, h) = rect
-        (hpx, wpx, dcolors) = self.image.shape
-        factor = hpx / _mm_card_height
-
-        return (int(x * factor), int(y * factor), int(w * factor), int(h * factor))
+        return self.frame.px_rect(rect)
 
 
     def _scale_section_rect(self, rect, size):
@@ -221,68 +367,89 @@ class StraightCard:
 
 
     def _save_debug_image(self, fn, img):
-        if self.save_debug_images:
+        if self.debug_images is not None:
+            self.debug_images.add(fn, img)
+        elif self.save_debug_images:
             cv2.imwrite(fn, img)
 
 
+    @profiling.timed('prep_line')
     def _extract_and_prep_line(self, line_name, threshold, rect, invert=False):
+        # every step writes into _prep_buffers, the result is good until line_name is
+        # prepped again
         # crop the title title out
-        x, y, w, h = self._px_rect_from_mm(rect)
-        img = self.image[y:y+h, x:x+w].copy()
-        logging.info(f'Extracted {line_name} dimensions: {img.shape}')
-        self._save_debug_image(f'{line_name}-1-crop.png', img)
+        crop = self.frame.crop(rect, out=_prep_buffers.get(line_name, 'crop', self.frame.crop_shape(rect)))
+        logging.info(f'Extracted {line_name} dimensions: {crop.shape}')
+        self._save_debug_image(f'{line_name}-1-crop.png', crop)
 
         # grayscale
-        img = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+        h, w = crop.shape[:2]
+        gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY, dst=_prep_buffers.get(line_name, 'gray', (h, w)))
         if invert:
-            img = ~img
-        self._save_debug_image(f'{line_name}-2-grayscale.png', img)
+            cv2.bitwise_not(gray, dst=gray)
+        self._save_debug_image(f'{line_name}-2-grayscale.png', gray)
 
         # scale to working resolution
-        h, w, *_ = img.shape
-        img = cv2.resize(img, (int(w * _px_working_line_height / h), _px_working_line_height))
+        size = (int(w * _px_working_line_height / h), _px_working_line_height)
+        img = cv2.resize(gray, size, dst=_prep_buffers.get(line_name, 'working', size[::-1]))
         self._save_debug_image(f'{line_name}-3-workingres.png', img)
 
         # blur image to smooth out scanning artifacts in the title background
-        img = cv2.GaussianBlur(img, (3, 3), 0)
-        self._save_debug_image(f'{line_name}-4-blurred.png', img)
+        blurred = cv2.GaussianBlur(img, (3, 3), 0, dst=_prep_buffers.get(line_name, 'blurred', img.shape))
+        self._save_debug_image(f'{line_name}-4-blurred.png', blurred)
 
-        # threshold to monochrome
-        ret, img = cv2.threshold(img, threshold, 255, cv2.THRESH_BINARY)
+        # threshold to monochrome, back into the working buffer
+        cv2.threshold(blurred, threshold, 255, cv2.THRESH_BINARY, dst=img)
         self._save_debug_image(f'{line_name}-5-threshold.png', img)
 
         return img
 
 
-    def read_title(self, threshold):
-        img = self._extract_and_prep_line("dbg-1-title", threshold, _title_section_rect)
-
-        # find the letter contours
-        edges = cv2.Canny(img, 120, 240, apertureSize=3)
-        self._save_debug_image("dbg-2-canny.png", edges)
-        contours, hierarchy = cv2.findContours(edges, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-        img = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) # back to color so we can draw on it
-
-        # save the contours as a list of TitleFigureArea's and remove dups
+    @profiling.timed('find_title_figures')
+    def _find_title_figures(self, img):
+        # find the letter contours. The image is already binary so there's no need for
+        # an edge pass, just invert it so the letters are the foreground. With a two
+        # level hierarchy every contour is either the outside of a figure or a hole in
+        # one (the inside of an o, the title box in the frame) so holes and the
+        # doubled edges Canny used to produce are dropped in one pass by parent.
+        inverted = cv2.bitwise_not(img, dst=_prep_buffers.get('title_figures', 'inverted', img.shape))
+        self._save_debug_image("dbg-2-inverted.png", inverted)
+        contours, hierarchy = cv2.findContours(inverted, cv2.RETR_CCOMP, cv2.CHAIN_APPROX_SIMPLE)
+        profiling.incr('title_contours', len(contours))
+        if hierarchy is not None:
+            is_outer = hierarchy[0][:, 3] < 0
+            logging.info(f'Detected {len(contours)} contours, {numpy.count_nonzero(~is_outer)} of them holes.')
+            contours = [contour for contour, outer in zip(contours, is_outer) if outer]
+
+        # save the contours as a table of figures
         mid_line = _StraightLine((0, _px_working_line_height/2), slope=0)  # REVIEW seems wrong
-        px_per_mm = img.shape[0] / _title_section_rect[3] # extract height in pixels / height in mm
-        logging.info(f'px_per_mm: {px_per_mm}, img height: {img.shape[0]}, img height in mm: {_title_section_rect[3]}')
+        px_per_mm = img.shape[0] / TITLE_SECTION_RECT[3] # extract height in pixels / height in mm
+        logging.info(f'px_per_mm: {px_per_mm}, img height: {img.shape[0]}, img height in mm: {TITLE_SECTION_RECT[3]}')
         title_area = _TitleArea(img, px_per_mm, _title_left_margin, _title_height, mid_line)
-        figures = list(map(lambda figure: _TitleFigureArea(title_area, figure), contours))
+        figures = _TitleFigureTable(title_area, contours)
         logging.info(f'Detected {len(figures)} figures in the title area.')
-        figures.sort(key = _FigureAreaSort)
-        figures = remove_dups_from_sorted(figures)
-        logging.info(f'After removing duplicates: {len(figures)}')
+        figures = figures.take(numpy.argsort(figures.sort_key(), kind='stable'))
+
+        profiling.incr('title_contours_after_holes', len(figures))
 
         # filter out the noisy contours
-        figures = list(filter(lambda figure: not figure.is_noise(), figures))
+        noise = numpy.zeros(len(figures), dtype=bool)
+        for name, mask in figures.noise_masks():
+            noise |= mask
+            profiling.incr(f'title_contours_after_{name}', len(figures) - numpy.count_nonzero(noise))
+        figures = figures.take(numpy.flatnonzero(~noise))
         logging.info(f'After filtering noise: {len(figures)}')
-        if len(figures) == 0:
-            return ''
-        contours = list(map(lambda figure: figure.outer_contour, figures))
+        return figures
+
+
+    def _crop_title(self, img, figures):
+        contours = figures.hulls
         if self.save_debug_images:
+            color = cv2.cvtColor(img, cv2.COLOR_GRAY2BGR) # back to color so we can draw on it
+            title_area = figures.title_area
+            mid_line = title_area.mid_line
             # draw the contours
-            img_contours = cv2.drawContours(img.copy(), contours, -1, (0,0,255), 2)
+            img_contours = cv2.drawContours(color.copy(), contours, -1, (0,0,255), 2)
             # draw the approximate bounding rectangle, FUTURE at mid_line slope
             x, y, w, h = title_area.bounding_rect()
             img_contours = cv2.rectangle(img_contours, (x, y), (w, h), (0,255,0), 2)
@@ -290,46 +457,134 @@ class StraightCard:
             img_contours = cv2.line(img_contours, (x, mid_line.get_y(x)), (x + w, mid_line.get_y(x + w)), (255,0,0), 2)
             self._save_debug_image("dbg-3-contours.png", img_contours)
 
-
-        # filter out the contours that are contained within the letters
-        figures_in = figures
-        figures = []
-        for i in range(0, len(figures_in)):
-            neighbors = figures[-1:]
-            neighbors.extend(figures_in[i+1:i+2])
-            if not figures_in[i].is_letter_hole(neighbors):
-                figures.append(figures_in[i])
-        figures_in = []
-        logging.info(f'After filtering out interiors: {len(figures)}')
-
         # find the straight bounding rectangle of the figures we've found
         x, y, w, h = cv2.boundingRect(numpy.concatenate(contours))
 
         # draw the contours on an image and save the result
-        contours = list(map(lambda figure: figure.outer_contour, figures))
-        img_contours = cv2.drawContours(img.copy(), contours, -1, (255,0,255), 2)
-        img_contours = cv2.rectangle(img_contours, (x, y), (x + w, y + h), (0,255,0), 2)
-        self._save_debug_image("dbg-4-contours.png", img_contours)
-
-        # Now that we've got the bounding box of the letters, crop it out
-        img = img[y:y+h, x:x+w].copy()
+        if self.save_debug_images:
+            img_contours = cv2.drawContours(color.copy(), contours, -1, (255,0,255), 2)
+            img_contours = cv2.rectangle(img_contours, (x, y), (x + w, y + h), (0,255,0), 2)
+            self._save_debug_image("dbg-4-contours.png", img_contours)
+
+        # Now that we've got the bounding box of the letters, crop it out. It stays
+        # gray (the engines read gray) and a view of the prepped line, OCR reads it
+        # before the line is prepped again.
+        x, y = max(0, x - _title_crop_margin), max(0, y - _title_crop_margin)
+        w, h = w + 2 * _title_crop_margin, h + 2 * _title_crop_margin
+        img = img[y:y+h, x:x+w]
         logging.info(f'tight crop dims: {img.shape}')
         self._save_debug_image("dbg-5-tight-crop.png", img)
+        return img
+
 
-        title = pytesseract.image_to_string(img, config=r'--psm 7').split('\n')[0]
+    def _read_title_line(self, img):
+        # (title, confidence) from a prepped title line
+        figures = self._find_title_figures(img)
+        if len(figures) == 0:
+            return '', 0
+        img = self._crop_title(img, figures)
+        title, confidence = self.ocr.image_to_string_with_confidence(img, psm=7)
+        return title.split('\n')[0], confidence
+
+
+    def read_title(self, threshold):
+        # one plain read at threshold, no cascade and no OCR cache
+        img = self._extract_and_prep_line("dbg-1-title", threshold, TITLE_SECTION_RECT)
+        figures = self._find_title_figures(img)
+        if len(figures) == 0:
+            return ''
+        title = self.ocr.image_to_string(self._crop_title(img, figures), psm=7).split('\n')[0]
+        logging.info(f'card title: {title}')
+        return title
+
+
+    def read_title_cascade(self, thresholds=_title_thresholds, validate=None):
+        # read the title at each threshold in turn, stopping at the first read that
+        # tesseract is confident of or that validate(title) (e.g. a catalog lookup)
+        # accepts. Most cards stop at the first, only the hard ones pay for retries.
+        key = None
+        best = ('', -1)
+        confirmed = False
+        for i, threshold in enumerate(thresholds):
+            img = self._extract_and_prep_line("dbg-1-title", threshold, TITLE_SECTION_RECT)
+            if i == 0 and self.ocr_cache is not None:
+                key = self.ocr_cache.key('title', img)
+                title = self.ocr_cache.get('title', key)
+                if title is not None:
+                    logging.info(f'card title (cached): {title}')
+                    return title
+            if i > 0:
+                profiling.incr('title_retries')
+
+            title, confidence = self._read_title_line(img)
+            logging.info(f'card title at threshold {threshold}: {title} (confidence {confidence:.0f})')
+            if title and (confidence >= _title_confident_read or (validate is not None and validate(title))):
+                best = (title, confidence)
+                confirmed = True
+                break
+            if confidence > best[1]:
+                best = (title, confidence)
+        else:
+            if len(thresholds) > 1:
+                profiling.incr('title_unconfirmed')
+
+        title = best[0]
         logging.info(f'card title: {title}')
+        # an unconfirmed read isn't cached, a later scan of the card gets its own retries
+        if key is not None and confirmed:
+            self.ocr_cache.put('title', key, title)
         return title
 
 
     def read_set_code(self):
-        img = self._extract_and_prep_line("dbg-6-set", 140, _footer_line2_section_rect, invert=True)
-        set = pytesseract.image_to_string(img, config=r'--psm 7').split()
+        img = self._extract_and_prep_line("dbg-6-set", 140, FOOTER_LINE2_SECTION_RECT, invert=True)
+        set = self.ocr.image_to_string(img, psm=7).split()
         logging.info(f'set: {ascii(set)}')
         return set[0] if len(set) > 0 else ''
 
 
     def read_collector_number(self):
-        img = self._extract_and_prep_line("dbg-7-cnc", 140, _footer_line1_section_rect, invert=True)
-        collector = pytesseract.image_to_string(img, config=r'--psm 7').split()
+        img = self._extract_and_prep_line("dbg-7-cnc", 140, FOOTER_LINE1_SECTION_RECT, invert=True)
+        collector = self.ocr.image_to_string(img, psm=7).split()
         logging.info(f'collector: {ascii(collector)}')
         return collector[0] if len(collector) > 0 else ''
+
+
+    def read_footer(self):
+        # both footer lines prepped as usual, then stacked into one image so a
+        # single OCR call reads them
+        line1 = self._extract_and_prep_line("dbg-7-cnc", 140, FOOTER_LINE1_SECTION_RECT, invert=True)
+        line2 = self._extract_and_prep_line("dbg-6-set", 140, FOOTER_LINE2_SECTION_RECT, invert=True)
+        if self.glyphs is not None:
+            with profiling.stage('glyphs'):
+                lines = [self.glyphs.read_line(line1), self.glyphs.read_line(line2)]
+            footer = parse_footer(*lines) if None not in lines else None
+            if footer is not None and footer.set_code and footer.collector_number:
+                logging.info(f'footer (glyphs): {ascii(lines)}')
+                profiling.incr('glyph_reads')
+                return footer
+            profiling.incr('glyph_fallbacks')
+        key = None
+        if self.ocr_cache is not None:
+            key = self.ocr_cache.key('footer', line1, line2)
+            lines = self.ocr_cache.get('footer', key)
+            if lines is not None:
+                logging.info(f'footer (cached): {ascii(lines)}')
+                return parse_footer(*lines)
+
+        width = max(line1.shape[1], line2.shape[1])
+        line2_top = line1.shape[0] + _footer_line_gap
+        img = _prep_buffers.get('footer', 'stacked', (line2_top + line2.shape[0], width))
+        img.fill(255)
+        img[:line1.shape[0], :line1.shape[1]] = line1
+        img[line2_top:, :line2.shape[1]] = line2
+        self._save_debug_image("dbg-8-footer.png", img)
+
+        lines = [line for line in self.ocr.image_to_string(img, psm=6).split('\n') if line.strip()]
+        logging.info(f'footer: {ascii(lines)}')
+        if len(lines) != 2:
+            # didn't split cleanly into two lines, read them one at a time
+            lines = [self.read_collector_number(), self.read_set_code()]
+        if key is not None and any(lines):
+            self.ocr_cache.put('footer', key, lines)
+        return parse_footer(*lines)
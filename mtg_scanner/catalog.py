@@ -0,0 +1,156 @@
+import json
+import logging
+import os
+import unicodedata
+import zlib
+
+# compact on-disk form of the catalog: a magic header followed by a zlib
+# compressed block of tab separated "name\tset\tcollector_number\tkey" lines, key
+# is normalize_name of the name so loading doesn't work it out again. Version 1
+# indexes had no key column.
+_magic = b'MTGCAT2\n'
+_magic_v1 = b'MTGCAT1\n'
+
+
+def normalize_name(name):
+    # casefold, strip accents and punctuation, collapse whitespace so that
+    # "Lim-Dûl's Vault" and "lim dul's vault" land on the same key
+    name = unicodedata.normalize('NFKD', name)
+    name = ''.join(ch for ch in name if not unicodedata.combining(ch))
+    name = ''.join(ch if ch.isalnum() else ' ' for ch in name.casefold())
+    return ' '.join(name.split())
+
+
+def _read_magic(fn):
+    with open(fn, 'rb') as f:
+        return f.read(len(_magic))
+
+
+class Catalog:
+    def __init__(self, entries, keys=None):
+        # entries is a list of (name, set, collector_number) tuples, set is casefolded.
+        # keys maps names to their normalize_name, as saved in an index, any missing
+        # are worked out here (once per name, reprints share it).
+        self.entries = entries
+        self._matcher = None
+        self.by_set_number = {}
+        self.by_name = {}
+        self._keys = dict(keys) if keys else {}
+        for i, (name, set_code, collector_number) in enumerate(entries):
+            self.by_set_number.setdefault((set_code, collector_number), i)
+            self.by_name.setdefault(self._key(name), []).append(i)
+            # double faced cards are printed with just the front face name on the title line
+            if ' // ' in name:
+                self.by_name.setdefault(self._key(name.split(' // ')[0]), []).append(i)
+
+
+    def _key(self, name):
+        key = self._keys.get(name)
+        if key is None:
+            key = self._keys[name] = normalize_name(name)
+        return key
+
+
+    def __len__(self):
+        return len(self.entries)
+
+
+    def _card(self, i):
+        name, set_code, collector_number = self.entries[i]
+        return {"name": name, "set": set_code, "collector_number": collector_number}
+
+
+    def lookup_set_number(self, set_code, collector_number):
+        i = self.by_set_number.get((set_code.casefold(), collector_number))
+        return self._card(i) if i is not None else None
+
+
+    def lookup_name(self, title):
+        indexes = self.by_name.get(normalize_name(title))
+        return self._card(indexes[0]) if indexes else None
+
+
+    def match_name(self, title, limit=5):
+        # local fuzzy match of an OCR'd title against every card name, the index
+        # is built the first time it is needed
+        if self._matcher is None:
+            from mtg_scanner.fuzzy import NameMatcher
+            names = set(entry[0] for entry in self.entries)
+            names.update(name.split(' // ')[0] for name in list(names) if ' // ' in name)
+            self._matcher = NameMatcher(names)
+        return self._matcher.match(title, limit)
+
+
+    def prints(self, name):
+        return [self._card(i) for i in self.by_name.get(normalize_name(name), [])]
+
+
+    @classmethod
+    def from_bulk_json(cls, fn):
+        # Scryfall bulk data "default-cards" file, a json array of card objects
+        logging.info(f'loading bulk data {fn}')
+        with open(fn, 'rb') as f:
+            cards = json.load(f)
+        entries = []
+        for card in cards:
+            if "name" not in card or "set" not in card or "collector_number" not in card:
+                continue
+            entries.append((card["name"], card["set"].casefold(), card["collector_number"]))
+        logging.info(f'bulk data contains {len(entries)} printings')
+        return cls(entries)
+
+
+    def save(self, fn):
+        text = '\n'.join('\t'.join(entry + (self._key(entry[0]),)) for entry in self.entries)
+        with open(fn, 'wb') as f:
+            f.write(_magic)
+            f.write(zlib.compress(text.encode('utf-8'), 6))
+
+
+    @classmethod
+    def load(cls, fn):
+        with open(fn, 'rb') as f:
+            data = f.read()
+        if not data.startswith((_magic, _magic_v1)):
+            raise ValueError(f'<{fn}> is not a card catalog index')
+        text = zlib.decompress(data[len(_magic):]).decode('utf-8')
+        rows = [line.split('\t') for line in text.split('\n')] if text else []
+        if data.startswith(_magic_v1):
+            return cls([tuple(row) for row in rows])
+        entries = [(name, set_code, collector_number) for name, set_code, collector_number, key in rows]
+        keys = {name: key for name, set_code, collector_number, key in rows}
+        # front face names of double faced cards are few, they're normalized in __init__
+        return cls(entries, keys)
+
+
+    @classmethod
+    def open(cls, fn):
+        # accept either a bulk json dump or a saved index. A dump is indexed once and
+        # the index written alongside it so the next run loads in a fraction of the time.
+        if _read_magic(fn) in (_magic, _magic_v1):
+            return cls.load(fn)
+
+        index_fn = fn + '.idx'
+        try:
+            # an index of the old version is written again in the new one
+            if os.path.getmtime(index_fn) >= os.path.getmtime(fn) and _read_magic(index_fn) == _magic:
+                return cls.load(index_fn)
+        except (OSError, ValueError):
+            pass
+        catalog = cls.from_bulk_json(fn)
+        try:
+            catalog.save(index_fn)
+            logging.info(f'saved catalog index {index_fn}')
+        except OSError:
+            logging.warning(f'Unable to save catalog index <{index_fn}>')
+        return catalog
+
+
+# catalogs opened in this process, by file name (each --jobs worker opens its own)
+_catalogs = {}
+
+
+def get_catalog(fn):
+    if fn not in _catalogs:
+        _catalogs[fn] = Catalog.open(fn)
+    return _catalogs[fn]
@@ -0,0 +1,416 @@
+import collections
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import json
+import logging
+import os
+import time
+
+import click
+from mtg_scanner import journal
+from mtg_scanner import profiling
+
+# Only what --help and argument parsing need is imported up here. OpenCV, numpy,
+# tesseract and requests are imported by the commands that use them, so
+# `mtg-scan --help` or `mtg-scan canonicalize` don't wait for the recognizer to load.
+
+# recognized cards are canonicalized in groups of this many, one /cards/collection call's worth
+_batch_size = 75
+# seconds a recognized card waits for its batch to fill before it's canonicalized anyway
+_batch_wait = 5
+
+# a card waiting for its batch: the (title, set_code, collector_number) read, the
+# (match, card) when it's already known from the journal, and the image's digest
+# and name when the result is to be journaled
+_Pending = collections.namedtuple('_Pending', ['record', 'result', 'digest', 'image'], defaults=(None, None, None))
+
+
+def _flush(pending, output, workers, profile_output=None, summary=None, results_journal=None):
+    if not pending:
+        return
+    from mtg_scanner.scryfall import canonicalize_batch
+    records = [entry.record for entry in pending if entry.result is None]
+    with profiling.recording(profiling.Profile(batch=len(records)) if profile_output and records else None) as p:
+        results = iter(canonicalize_batch(records, workers=workers) if records else [])
+    for entry in pending:
+        rval, cs = entry.result if entry.result is not None else next(results)
+        logging.info(f'Canonicalized: {rval}\t{cs}')
+        print(f'{cs}', file=output)
+        if results_journal is not None and entry.digest is not None:
+            results_journal.record(entry.digest, entry.image, entry.record, (rval, cs))
+    output.flush()
+    pending.clear()
+    if p is not None:
+        profiling.write(p, profile_output)
+        summary.add(p)
+
+
+def _setup_logging(debug):
+    logging.basicConfig(format='%(levelname)s\t%(message)s',
+            level=logging.INFO if debug else logging.WARN, force=True)
+    logging.getLogger("root").setLevel(logging.DEBUG if debug else logging.WARN)
+
+
+class _DefaultGroup(click.Group):
+    # `mtg-scan IMAGE...` predates the subcommands, anything that isn't one of them
+    # (no arguments at all too) is handed to scan. --help lists scan's options after
+    # the commands, they're the ones given without a command name.
+    def parse_args(self, ctx, args):
+        if not args or args[0] not in self.commands and args[0] not in ctx.help_option_names:
+            args = ['scan'] + args
+        return super().parse_args(ctx, args)
+
+
+    def format_help(self, ctx, formatter):
+        super().format_help(ctx, formatter)
+        scan = self.commands['scan']
+        with click.Context(scan, info_name='scan', parent=ctx) as scan_ctx:
+            records = [param.get_help_record(scan_ctx) for param in scan.get_params(scan_ctx)
+                if param is not scan.get_help_option(scan_ctx)]
+        records = [record for record in records if record is not None]
+        with formatter.section('Options of scan, the default command'):
+            formatter.write_dl(records)
+
+
+@click.group(cls=_DefaultGroup, help='Recognize Magic cards in images. scan is the default command, '
+        '`mtg-scan [OPTIONS] IMAGE...` is `mtg-scan scan [OPTIONS] IMAGE...`.')
+def main():
+    pass
+
+
+def _apply_options(fn, options):
+    for option in reversed(options):
+        fn = option(fn)
+    return fn
+
+
+def _scryfall_options(fn):
+    # options of every command that canonicalizes
+    return _apply_options(fn, [
+        click.option('--debug/--nodebug', default=False),
+        click.option('--catalog', type=click.Path(exists=True, dir_okay=False),
+            help='Scryfall default-cards bulk json (or its saved .idx) to resolve cards offline and '
+            'check title reads against'),
+        click.option('--cache/--no-cache', default=True, help='Keep Scryfall responses in the user cache dir'),
+        click.option('--cache-ttl', type=float, default=168, show_default=True,
+            help='Hours before a cached Scryfall response is revalidated'),
+        click.option('--http-workers', type=click.IntRange(min=1), default=8, show_default=True,
+            help='Scryfall lookups to keep in flight at once'),
+        click.option('--api-url', default='https://api.scryfall.com', show_default=True,
+            help='Scryfall API base url, e.g. a local stand-in server'),
+    ])
+
+
+def _recognizer_options(fn):
+    # options scan and serve share
+    return _apply_options(fn, [
+        click.option('-j', '--jobs', type=click.IntRange(min=0), default=1, show_default=True,
+            help='Recognizer processes to run, 0 for one per core'),
+        click.option('--ocr', type=click.Choice(['auto', 'capi', 'pytesseract']), default='auto', show_default=True,
+            help='OCR backend, capi keeps tesseract loaded in process'),
+        click.option('--min-dpi', type=click.IntRange(min=0), default=500, show_default=True,
+            help='Decode finer jpeg scans at reduced size down to this resolution, 0 to always decode in full'),
+        click.option('--ocr-cache/--no-ocr-cache', default=False, show_default=True,
+            help='Reuse the OCR of title and footer crops that look like ones read before (kept in the user cache '
+            'dir). Titles only need to look alike, so two cards with near identical titles can get mixed up'),
+        click.option('--fingerprint-index', type=click.Path(exists=True, dir_okay=False),
+            help='Identify cards by their art with an index from build-index, OCR only the ones it isn\'t sure of'),
+        click.option('--glyph-bank', type=click.Path(exists=True, dir_okay=False),
+            help='Read footers with a glyph bank from build-glyphs instead of OCR, OCR only the ones it isn\'t sure of'),
+        click.option('--localize/--no-localize', 'localize_card', default=True, show_default=True,
+            help='Find the card in the image first, for scans with a border around the card or a slight tilt'),
+        click.option('--debug-images', type=click.Path(file_okay=False), default=None, metavar='DIR',
+            help='Write the intermediate images of cards to a subdirectory of DIR per card, in the background'),
+        click.option('--debug-every', type=click.IntRange(min=1), default=1, show_default=True, metavar='N',
+            help='With --debug-images, keep every Nth card (per recognizer process)'),
+        click.option('--debug-failures', is_flag=True, default=False,
+            help='With --debug-images, keep only cards missing a title, set or number, along with their scan'),
+    ])
+
+
+def _debug_images(directory, every, failures_only):
+    # the debug_images option of recognize
+    return (directory, every, failures_only) if directory else None
+
+
+def _setup_scryfall(api_url, catalog, cache, cache_ttl):
+    # returns the ResponseCache, if any
+    from mtg_scanner import scryfall
+    from mtg_scanner.cache import ResponseCache
+    from mtg_scanner.catalog import get_catalog
+    scryfall.set_api_base(api_url)
+    if catalog:
+        scryfall.set_catalog(get_catalog(catalog))
+    if not cache:
+        return None
+    response_cache = ResponseCache(ttl=cache_ttl * 60 * 60)
+    scryfall.set_cache(response_cache)
+    return response_cache
+
+
+def _report_cache(response_cache):
+    # the run summary goes to stderr whatever the log level
+    if response_cache is None:
+        return
+    stats = response_cache.stats()
+    click.echo(f'scryfall cache: {stats["hits"]} hits, {stats["misses"]} misses, '
+        f'{stats["revalidated"]} revalidated', err=True)
+
+
+def _plan(images, results_journal, resume):
+    # (image, digest, known) for each image, known ones aren't recognized again:
+    # they're in the journal (when resuming) or a copy of an earlier image. The
+    # None of an idle watched directory is passed along. An image that can't be
+    # read gets no digest, the recognizer reports it and it isn't journaled.
+    seen = set()
+    for fn in images:
+        if fn is None:
+            yield None
+            continue
+        try:
+            digest = journal.file_digest(fn)
+        except OSError as e:
+            logging.info(f'cannot digest {fn}: {e}')
+            yield fn, None, False
+            continue
+        yield fn, digest, digest in seen or (resume and results_journal.get(digest) is not None)
+        seen.add(digest)
+
+
+def _item_name(item):
+    # an image file's path, or the name of a scanned (name, image) page
+    return item if isinstance(item, str) else item[0]
+
+
+def _recognize_new(recognize_item, planned):
+    # runs in the recognizer process, only the item's name goes back with the result,
+    # not a scanned page's pixels
+    if planned is None:
+        return None
+    item, digest, known = planned
+    return _item_name(item), digest, None if known else recognize_item(item)
+
+
+@main.command(help='Recognize card images (the default command)')
+@click.argument('image', nargs=-1, type=click.Path(exists=True))
+@click.option('-o', '--output', type=click.File('w'), default='-')
+@click.option('--scanner', is_flag=False, flag_value='', default=None, metavar='[DEVICE]',
+        help='Recognize pages straight from a SANE scanner\'s ADF (first device if none given, '
+        'fake:DIR replays a directory of images)')
+@click.option('--scanner-source', default='ADF Front', show_default=True)
+@click.option('--watch', type=click.Path(exists=True, file_okay=False), default=None, metavar='DIR',
+        help='Recognize images as they land in DIR (and the ones already there), writing each card '
+        'out as soon as it\'s resolved, until Ctrl-C')
+@click.option('--profile', 'profile_output', type=click.File('w'), default=None, metavar='FILE',
+        help='Write stage timings and counters as json lines to FILE, one per image and per '
+        'canonicalized batch, then a summary with percentiles for the run')
+@click.option('--journal', 'journal_fn', type=click.Path(dir_okay=False), default=None, metavar='FILE',
+        help='Append what was read and resolved for each image to FILE (json lines keyed by the '
+        'image\'s sha256), copies of one image are only recognized once')
+@click.option('--resume', is_flag=True, default=False,
+        help='Skip images already in the --journal, only canonicalizing again the ones Scryfall didn\'t resolve')
+@_scryfall_options
+@_recognizer_options
+def scan(image, output, scanner, scanner_source, watch, profile_output, journal_fn, resume, debug, catalog, cache,
+        cache_ttl, http_workers, api_url, jobs, ocr, min_dpi, ocr_cache, fingerprint_index, glyph_bank,
+        localize_card, debug_images, debug_every, debug_failures):
+    if resume and journal_fn is None:
+        raise click.UsageError('--resume needs --journal')
+    if journal_fn is not None and scanner is not None:
+        raise click.UsageError('--journal works with image files, not --scanner')
+    if sum([bool(image), scanner is not None, watch is not None]) > 1:
+        raise click.UsageError('Give images, --scanner or --watch, not more than one')
+    from mtg_scanner import recognize
+    from mtg_scanner import scanner as scanner_device
+    _setup_logging(debug)
+    response_cache = _setup_scryfall(api_url, catalog, cache, cache_ttl)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    dev = None
+    options = dict(debug=debug, ocr=ocr, profile=profile_output is not None, ocr_cache=ocr_cache,
+        fingerprint_index=fingerprint_index, glyph_bank=glyph_bank, catalog=catalog, localize_card=localize_card,
+        debug_images=_debug_images(debug_images, debug_every, debug_failures))
+    if scanner is not None:
+        try:
+            dev = scanner_device.open_device(scanner, scanner_source)
+        except RuntimeError as e:
+            raise click.ClickException(str(e))
+        recognize_item = functools.partial(recognize.recognize_page, **options)
+        items = scanner_device.scan_pages(dev)
+    else:
+        recognize_item = functools.partial(recognize.recognize_file, min_dpi=min_dpi, **options)
+        items = image
+        if watch is not None:
+            from mtg_scanner.watch import watch_directory
+            items = watch_directory(watch)
+    results_journal = None
+    if journal_fn is not None:
+        results_journal = journal.Journal(journal_fn)
+        items = _plan(items, results_journal, resume)
+    else:
+        items = (None if item is None else (item, None, False) for item in items)
+    recognize_item = functools.partial(_recognize_new, recognize_item)
+
+    executor = None
+    if jobs > 1 and (dev is not None or watch is not None or len(image) > 1):
+        # results come back in input order however the workers finish
+        executor = ProcessPoolExecutor(max_workers=jobs, initializer=recognize.init_worker,
+            initargs=(logging.INFO if debug else logging.WARN,))
+        recognized = recognize.imap(executor, recognize_item, items, ahead=2 * jobs)
+    else:
+        recognized = map(recognize_item, items)
+
+    summary = profiling.RunSummary()
+    pending = []
+    reads = {}      # digest -> record read from it in this run, None if recognizing it failed
+    skipped = copies = 0
+    batch_started = None    # when the first card of the pending batch came in
+    try:
+        for planned in recognized:
+            if planned is None:
+                # the watched directory or the scanner is idle, don't hold back what's been read
+                _flush(pending, output, http_workers, profile_output, summary, results_journal)
+                continue
+            if not pending:
+                batch_started = time.monotonic()
+            name, digest, r = planned
+            if r is None and digest in reads:
+                copies += 1
+                if reads[digest] is None:
+                    logging.warning(f'Unable to recognize <{name}>, a copy of an image that failed')
+                    continue
+                pending.append(_Pending(reads[digest]))
+            elif r is None:
+                skipped += 1
+                entry = results_journal.get(digest)
+                record = reads[digest] = (entry["title"], entry["set_code"], entry["collector_number"])
+                if journal.is_resolved(entry):
+                    pending.append(_Pending(record, (entry["match"], entry["card"])))
+                else:
+                    pending.append(_Pending(record, digest=digest, image=name))
+            else:
+                if r.profile is not None:
+                    profiling.write(r.profile, profile_output)
+                    summary.add(r.profile)
+                record = None if r.error else (r.title, r.set_code, r.collector_number)
+                if digest is not None:
+                    reads[digest] = record
+                if r.error:
+                    logging.warning(r.error)
+                    continue
+                pending.append(_Pending(record, digest=digest, image=name))
+            if len(pending) >= _batch_size or time.monotonic() - batch_started >= _batch_wait:
+                _flush(pending, output, http_workers, profile_output, summary, results_journal)
+    except KeyboardInterrupt:
+        # stop taking images (the one being recognized is dropped), what's been read is written out below
+        logging.warning('Interrupted, writing out the cards read so far')
+    except scanner_device.ScannerError as e:
+        # reported once the cards scanned before it are written out
+        raise click.ClickException(str(e))
+    finally:
+        # a scanner jam or any other error still writes out (and journals) what was read before it
+        _flush(pending, output, http_workers, profile_output, summary, results_journal)
+        if executor is not None:
+            executor.shutdown()
+        if dev is not None:
+            dev.close()
+        if results_journal is not None:
+            results_journal.close()
+    if results_journal is not None:
+        logging.info(f'journal: {skipped} images resumed, {copies} copies of other images')
+
+    _report_cache(response_cache)
+    if profile_output is not None:
+        print(json.dumps(summary.to_json()), file=profile_output)
+
+
+@main.command('build-index', help='Fingerprint the card art of the reference images in DIRECTORY for '
+        'scan --fingerprint-index. Reference images are whole card images named SET_NUMBER[_TITLE], '
+        'e.g. "dom_199_Muldrotha, the Gravetide.jpg"')
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default='fingerprints.npz', show_default=True)
+@click.option('--debug/--nodebug', default=False)
+def build_index(directory, output, debug):
+    from mtg_scanner import fingerprint
+    _setup_logging(debug)
+    index = fingerprint.FingerprintIndex.build(directory)
+    index.save(output)
+    click.echo(f'{len(index)} fingerprints written to {output}')
+
+
+@main.command('build-glyphs', help='Collect the glyph samples of labeled footer lines for scan --glyph-bank. '
+        'LABELS has a line IMAGE<tab>TEXT per image, IMAGE (relative to LABELS) a prepped footer line as '
+        '--debug-images writes them (dbg-7-cnc-5-threshold.png, dbg-6-set-5-threshold.png) and TEXT '
+        'what it says, e.g. "199/269 M"')
+@click.argument('labels', type=click.Path(exists=True, dir_okay=False))
+@click.option('-o', '--output', type=click.Path(dir_okay=False), default='glyphs.npz', show_default=True)
+@click.option('--debug/--nodebug', default=False)
+def build_glyphs(labels, output, debug):
+    from mtg_scanner import glyphs
+    _setup_logging(debug)
+    bank = glyphs.GlyphBank.build(labels)
+    bank.save(output)
+    click.echo(f'{len(bank)} glyph samples of {len(set(bank.labels))} characters written to {output}')
+
+
+def _read_records(lines):
+    # TITLE[<tab>SET[<tab>NUMBER]] per line, blank lines are skipped
+    for line in lines:
+        fields = line.rstrip('\r\n').split('\t')
+        if not fields[0].strip():
+            continue
+        if len(fields) > 3:
+            logging.warning(f'Ignoring extra fields in <{line.strip()}>')
+        title, set_code, collector_number = (fields + ['', ''])[:3]
+        yield title.strip(), set_code.strip() or None, collector_number.strip() or None
+
+
+@main.command(help='Canonicalize cards already read, one per line of INPUT (stdin by default) as '
+        'TITLE<tab>SET<tab>NUMBER (set and number optional). Doesn\'t load the recognizer.')
+@click.argument('input', type=click.File('r'), default='-')
+@click.option('-o', '--output', type=click.File('w'), default='-')
+@click.option('--profile', 'profile_output', type=click.File('w'), default=None, metavar='FILE',
+        help='Write stage timings and counters as json lines to FILE, one per canonicalized batch, '
+        'then a summary for the run')
+@_scryfall_options
+def canonicalize(input, output, profile_output, debug, catalog, cache, cache_ttl, http_workers, api_url):
+    _setup_logging(debug)
+    response_cache = _setup_scryfall(api_url, catalog, cache, cache_ttl)
+    summary = profiling.RunSummary()
+    pending = []
+    for record in _read_records(input):
+        pending.append(_Pending(record))
+        if len(pending) >= _batch_size:
+            _flush(pending, output, http_workers, profile_output, summary)
+    _flush(pending, output, http_workers, profile_output, summary)
+    _report_cache(response_cache)
+    if profile_output is not None:
+        print(json.dumps(summary.to_json()), file=profile_output)
+
+
+@main.command(help='Keep the recognizer loaded and recognize images sent to it over HTTP, on a TCP port '
+        'or a Unix socket. POST an image file to /recognize, or json {"images": [path, ...]}, '
+        'for json results')
+@click.option('--host', default='127.0.0.1', show_default=True)
+@click.option('--port', type=click.IntRange(min=0, max=65535), default=8765, show_default=True)
+@click.option('--socket', 'unix_socket', type=click.Path(dir_okay=False),
+        help='Listen on this Unix socket instead of a TCP port')
+@_scryfall_options
+@_recognizer_options
+def serve(host, port, unix_socket, debug, catalog, cache, cache_ttl, http_workers, api_url, jobs, ocr,
+        min_dpi, ocr_cache, fingerprint_index, glyph_bank, localize_card, debug_images, debug_every,
+        debug_failures):
+    from mtg_scanner import server
+    _setup_logging(debug)
+    _setup_scryfall(api_url, catalog, cache, cache_ttl)
+    if jobs == 0:
+        jobs = os.cpu_count() or 1
+    options = dict(debug=debug, ocr=ocr, ocr_cache=ocr_cache, fingerprint_index=fingerprint_index,
+        glyph_bank=glyph_bank, catalog=catalog, localize_card=localize_card,
+        debug_images=_debug_images(debug_images, debug_every, debug_failures))
+    recognizer = server.Recognizer(options, min_dpi, jobs=jobs, http_workers=http_workers)
+    click.echo(f'listening on {unix_socket or f"http://{host}:{port}"}', err=True)
+    server.serve(recognizer, host, port, unix_socket)
+
+if __name__ == '__main__':
+    main()
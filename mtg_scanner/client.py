@@ -0,0 +1,100 @@
+import logging
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from mtg_scanner import profiling
+
+# Scryfall asks clients to stay around 10 requests a second
+_default_rate = 10
+_default_burst = 10
+_default_pool_size = 16
+_default_timeout = 30
+_retry_statuses = (429, 500, 502, 503, 504)
+_user_agent = 'mtg-scanner/0.1.0'
+
+
+class TokenBucket:
+    def __init__(self, rate, burst):
+        self.rate = rate
+        self.capacity = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class ScryfallClient:
+    def __init__(self, rate=_default_rate, burst=_default_burst, pool_size=_default_pool_size,
+            retries=4, backoff=0.5, timeout=_default_timeout):
+        self.bucket = TokenBucket(rate, burst)
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+
+        # one keep-alive session shared by every thread, sized so that a full
+        # thread pool never has to open a fresh TLS connection
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+        self.session.headers.update({'User-Agent': _user_agent, 'Accept': 'application/json'})
+
+
+    def _retry_delay(self, attempt, response=None):
+        if response is not None and 'Retry-After' in response.headers:
+            try:
+                return float(response.headers['Retry-After'])
+            except ValueError:
+                pass
+        return self.backoff * (2 ** attempt) * (1 + random.random() / 2)
+
+
+    def request(self, method, url, **kwargs):
+        kwargs.setdefault('timeout', self.timeout)
+        for attempt in range(self.retries + 1):
+            with profiling.stage('rate_limit_wait'):
+                self.bucket.acquire()
+            profiling.incr('http_requests')
+            try:
+                with profiling.stage('http'):
+                    response = self.session.request(method, url, **kwargs)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                if attempt == self.retries:
+                    raise
+                delay = self._retry_delay(attempt)
+                logging.info(f'{method} {url} failed ({e}), retrying in {delay:.1f}s')
+            else:
+                if response.status_code not in _retry_statuses or attempt == self.retries:
+                    return response
+                delay = self._retry_delay(attempt, response)
+                logging.info(f'{method} {url} returned {response.status_code}, retrying in {delay:.1f}s')
+            profiling.incr('http_retries')
+            time.sleep(delay)
+
+
+    def get(self, url, headers=None):
+        return self.request('GET', url, headers=headers)
+
+
+    def post(self, url, json=None):
+        return self.request('POST', url, json=json)
+
+
+    def close(self):
+        self.session.close()
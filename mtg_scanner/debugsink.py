@@ -0,0 +1,119 @@
+import logging
+import multiprocessing.util
+import os
+import queue
+import threading
+
+import cv2
+import numpy
+
+# cards whose images can wait for the writer, past that they're dropped rather
+# than slowing recognition down
+_max_queued_cards = 32
+
+
+class CardImages:
+    # the debug images of one card, kept in memory until it's known whether the
+    # card is to be written (sampled or, with failures_only, failed)
+    def __init__(self, sink, subdirectory, sampled):
+        self.sink = sink
+        self.subdirectory = subdirectory
+        self.sampled = sampled
+        self.images = []
+
+
+    def add(self, fn, img):
+        # a copy, the prep buffers it came from are reused by the next card
+        self.images.append((fn, numpy.array(img)))
+
+
+    def finish(self, failed, card_image=None):
+        # card_image (the whole scan) is kept along with a failed card's images
+        if not (self.sampled or failed):
+            return
+        if failed and card_image is not None:
+            self.add('card.jpg', card_image)
+        if self.images:
+            self.sink._submit(self.subdirectory, self.images)
+
+
+class DebugSink:
+    # Writes debug images on a background thread, one subdirectory of directory
+    # per card. Every nth card is kept, or with failures_only just the cards that
+    # didn't read cleanly.
+    def __init__(self, directory, every=1, failures_only=False):
+        self.directory = directory
+        self.every = every
+        self.failures_only = failures_only
+        self.dropped = 0
+        self._cards = 0
+        self._lock = threading.Lock()
+        self._queue = queue.Queue(maxsize=_max_queued_cards)
+        self._thread = None
+        # runs at exit in the main process and in pool workers, which leave
+        # without running atexit handlers
+        multiprocessing.util.Finalize(self, self.close, exitpriority=10)
+
+
+    def card(self, name):
+        # a CardImages for the card read from name, None when it won't be kept whatever happens
+        with self._lock:
+            number = self._cards
+            self._cards += 1
+        sampled = not self.failures_only and self.every > 0 and number % self.every == 0
+        if not sampled and not self.failures_only:
+            return None
+        stem = os.path.splitext(os.path.basename(name))[0] or 'card'
+        # numbered per process, so include the process to keep workers apart
+        return CardImages(self, f'{stem}.{os.getpid()}.{number}', sampled)
+
+
+    def _submit(self, subdirectory, images):
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._write, name='debug-images', daemon=True)
+                self._thread.start()
+        try:
+            self._queue.put_nowait((subdirectory, images))
+        except queue.Full:
+            with self._lock:
+                self.dropped += 1
+            if self.dropped == 1:
+                logging.warning('debug images: writer is behind, dropping cards')
+
+
+    def _write(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                return
+            subdirectory, images = item
+            path = os.path.join(self.directory, subdirectory)
+            try:
+                os.makedirs(path, exist_ok=True)
+                for fn, img in images:
+                    cv2.imwrite(os.path.join(path, fn), img)
+            except (OSError, cv2.error) as e:
+                logging.warning(f'debug images: unable to write <{path}>: {e}')
+
+
+    def close(self):
+        # waits for what's queued to be written
+        with self._lock:
+            thread, self._thread = self._thread, None
+        if thread is not None:
+            self._queue.put(None)
+            thread.join()
+        if self.dropped:
+            logging.warning(f'debug images: dropped {self.dropped} cards')
+
+
+# one sink per configuration per process
+_sinks = {}
+
+
+def get_sink(directory, every=1, failures_only=False):
+    key = (directory, every, failures_only)
+    if key not in _sinks:
+        _sinks[key] = DebugSink(directory, every, failures_only)
+    return _sinks[key]
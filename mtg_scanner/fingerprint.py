@@ -0,0 +1,137 @@
+import collections
+import logging
+import os
+
+import cv2
+import numpy
+
+from mtg_scanner import loader
+from mtg_scanner import localize
+from mtg_scanner.hashes import hamming
+
+# art box of a modern frame in mm, a little inside it so the frame edge stays out
+_art_section_rect = (6, 12, 51, 35)
+
+# the art is shrunk to _dct_size square and the lowest _hash_size square
+# frequencies of its DCT kept, one bit each (above or below their median)
+_dct_size = 64
+_hash_size = 16
+_hash_bits = _hash_size * _hash_size
+
+# a match is taken without OCR when it is this close (fraction of the bits) and
+# the nearest different printing is at least _min_margin further away. Reprints
+# sharing the art are as close as the same card, so those fall back to OCR.
+_max_distance = 0.25
+_min_margin = 0.1
+
+_image_extensions = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.ppm', '.pgm')
+
+FingerprintMatch = collections.namedtuple('FingerprintMatch',
+    ['title', 'set_code', 'collector_number', 'distance', 'margin'])
+
+
+def art_fingerprint(img, frame=None):
+    # frame is a localize.CardFrame for img, by default the card fills it
+    frame = frame if frame is not None else localize.CardFrame(img)
+    art = cv2.cvtColor(frame.crop(_art_section_rect), cv2.COLOR_BGR2GRAY)
+    art = cv2.resize(art, (_dct_size, _dct_size), interpolation=cv2.INTER_AREA).astype(numpy.float32)
+    coefficients = cv2.dct(art)[:_hash_size, :_hash_size].ravel()
+    # the DC term is just the overall brightness, leave it out of the median
+    return numpy.packbits(coefficients > numpy.median(coefficients[1:]))
+
+
+def parse_reference_name(fn):
+    # reference images are named SET_NUMBER[_TITLE].ext, e.g. dom_199_Muldrotha, the Gravetide.jpg
+    stem = os.path.splitext(os.path.basename(fn))[0]
+    parts = stem.split('_', 2)
+    if len(parts) < 2:
+        return None
+    return (parts[2] if len(parts) > 2 else ''), parts[0].casefold(), parts[1]
+
+
+class FingerprintIndex:
+    def __init__(self, hashes, titles, set_codes, collector_numbers):
+        self.hashes = hashes
+        self.titles = list(titles)
+        self.set_codes = list(set_codes)
+        self.collector_numbers = list(collector_numbers)
+        # printing number of each reference, several images of one printing share it
+        printings = {}
+        self.printings = numpy.array([printings.setdefault(key, len(printings))
+            for key in zip(self.set_codes, self.collector_numbers)], dtype=numpy.int32)
+
+
+    def __len__(self):
+        return len(self.titles)
+
+
+    @classmethod
+    def build(cls, directory, min_dpi=loader.DEFAULT_MIN_DPI):
+        hashes, labels = [], []
+        for root, dirs, files in os.walk(directory):
+            dirs.sort()
+            for fn in sorted(files):
+                if not fn.lower().endswith(_image_extensions):
+                    continue
+                label = parse_reference_name(fn)
+                if label is None:
+                    logging.warning(f'Skipping <{fn}>, reference images are named SET_NUMBER[_TITLE]')
+                    continue
+                img = loader.load_card_image(os.path.join(root, fn), min_dpi)
+                if img is None:
+                    logging.warning(f'Unable to read image <{fn}>')
+                    continue
+                hashes.append(art_fingerprint(img))
+                labels.append(label)
+        logging.info(f'fingerprinted {len(labels)} reference images')
+        hashes = numpy.array(hashes, numpy.uint8).reshape(-1, _hash_bits // 8)
+        return cls(hashes, *(zip(*labels) if labels else ([], [], [])))
+
+
+    def save(self, fn):
+        with open(fn, 'wb') as f:
+            numpy.savez_compressed(f, hashes=self.hashes, titles=numpy.array(self.titles, dtype=str),
+                set_codes=numpy.array(self.set_codes, dtype=str),
+                collector_numbers=numpy.array(self.collector_numbers, dtype=str))
+
+
+    @classmethod
+    def load(cls, fn):
+        with numpy.load(fn) as data:
+            return cls(data['hashes'], data['titles'], data['set_codes'], data['collector_numbers'])
+
+
+    def nearest(self, img, frame=None):
+        # FingerprintMatch for the closest reference, margin is how much further
+        # the closest reference of a different printing is (1 if there's none)
+        if len(self) == 0:
+            return None
+        distances = hamming(self.hashes, art_fingerprint(img, frame))
+        best = int(numpy.argmin(distances))
+        others = distances[self.printings != self.printings[best]]
+        second = int(others.min()) if len(others) else _hash_bits
+        return FingerprintMatch(self.titles[best], self.set_codes[best], self.collector_numbers[best],
+            int(distances[best]) / _hash_bits, (second - int(distances[best])) / _hash_bits)
+
+
+    def identify(self, img, frame=None):
+        # the confident match for img, None when OCR should have a look
+        match = self.nearest(img, frame)
+        if match is None:
+            return None
+        logging.info(f'fingerprint: {match.title} ({match.set_code}) {match.collector_number} '
+            f'distance {match.distance:.3f} margin {match.margin:.3f}')
+        if match.distance > _max_distance or match.margin < _min_margin:
+            return None
+        return match
+
+
+# indexes loaded in this process, by file name
+_indexes = {}
+
+
+def get_index(fn):
+    if fn not in _indexes:
+        _indexes[fn] = FingerprintIndex.load(fn)
+        logging.info(f'loaded {len(_indexes[fn])} fingerprints from {fn}')
+    return _indexes[fn]
@@ -0,0 +1,79 @@
+import numpy
+
+from mtg_scanner.catalog import normalize_name
+
+# substitutions that undo the usual tesseract confusions in card titles; they are
+# applied to both the names and the query so either spelling folds to the same key
+_ocr_confusions = [('rn', 'm'), ('vv', 'w'), ('cl', 'd'), ('0', 'o'), ('1', 'l'), ('|', 'l'),
+    ('!', 'l'), ('i', 'l'), ('5', 's'), ('8', 'b')]
+
+# candidates taken from the trigram shortlist for the more expensive edit distance
+_shortlist_size = 8
+
+
+def ocr_fold(text):
+    text = normalize_name(text)
+    for wrong, right in _ocr_confusions:
+        text = text.replace(wrong, right)
+    return text
+
+
+def _trigrams(text):
+    text = f'  {text} '
+    return {text[i:i + 3] for i in range(len(text) - 2)}
+
+
+def _substring_distance(query, name):
+    # edit distance between query and the closest substring of name, so a title
+    # that OCR clipped at either end still scores as a good match
+    previous = [0] * (len(name) + 1)
+    for i, q in enumerate(query, 1):
+        current = [i]
+        for j, n in enumerate(name, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (q != n)))
+        previous = current
+    return min(previous)
+
+
+class NameMatcher:
+    def __init__(self, names):
+        self.names = sorted(set(names))
+        self.folded = [ocr_fold(name) for name in self.names]
+
+        postings = {}
+        gram_counts = numpy.empty(len(self.names), numpy.int32)
+        for i, folded in enumerate(self.folded):
+            grams = _trigrams(folded)
+            gram_counts[i] = len(grams)
+            for gram in grams:
+                postings.setdefault(gram, []).append(i)
+        self.postings = {gram: numpy.array(ids, numpy.int32) for gram, ids in postings.items()}
+        self.gram_counts = gram_counts
+
+
+    def match(self, title, limit=5):
+        # best (name, score) candidates for an OCR'd title, score in 0..1
+        query = ocr_fold(title)
+        if not query or not self.names:
+            return []
+        grams = _trigrams(query)
+        hits = [self.postings[gram] for gram in grams if gram in self.postings]
+        if not hits:
+            return []
+
+        # dice coefficient over trigram sets, all names at once
+        shared = numpy.bincount(numpy.concatenate(hits), minlength=len(self.names))
+        dice = 2 * shared / (len(grams) + self.gram_counts)
+        count = min(_shortlist_size, len(self.names))
+        shortlist = numpy.argpartition(-dice, count - 1)[:count]
+
+        scored = []
+        for i in shortlist:
+            if shared[i] == 0:
+                continue
+            folded = self.folded[i]
+            similarity = 1 - _substring_distance(query, folded) / len(query)
+            coverage = min(1, len(query) / len(folded))
+            scored.append((self.names[i], max(0.0, similarity) * (0.5 + 0.5 * coverage)))
+        scored.sort(key=lambda candidate: -candidate[1])
+        return scored[:limit]
@@ -0,0 +1,233 @@
+import logging
+import os
+import statistics
+
+import cv2
+import numpy
+
+# The footer lines are a handful of capitals, digits, "/" and "•" in one font, so
+# instead of running OCR on them they're cut into glyphs and each glyph is matched
+# against a bank of labeled samples of that font.
+
+# a glyph's cell in pixels (width, height). Glyphs are scaled so the line's letters
+# are _cell_letter_height rows tall with their tops on row _cell_letter_top, so
+# small marks like "•" keep their size and place in the cell.
+_cell_size = (24, 32)
+_cell_letter_height = 20
+_cell_letter_top = 6
+_cell_pixels = _cell_size[0] * _cell_size[1]
+
+# prepped lines are binary with letters about 45 rows tall, every other row and
+# column is plenty to find and match them and a quarter of the work
+_subsample = 2
+
+# below are in letter heights: ink smaller than this both ways is a speck
+_min_speck = 0.12
+# a glyph wider than this is letters run together, cut into pieces about
+# _glyph_width wide at the columns with the least ink
+_max_glyph_width = 1.15
+_glyph_width = 0.72
+# a gap between glyphs this wide is a space
+_space_width = 0.45
+
+# a glyph is unknown when its mean squared difference (per cell pixel, 0 to 1)
+# from the nearest sample is over this
+_max_distance = 0.08
+# or when a sample of another character is within this of the nearest one's distance
+_min_margin = 0.01
+# samples of a character closer than this to one already in the bank add nothing
+_duplicate_distance = 0.01
+
+
+def _letter_band(y, heights):
+    # (top, height) of the letters: the tall components, "/" may reach a bit further
+    # a line has a dozen blobs, numpy.median costs more than the sorting does
+    tall = heights >= 0.6 * heights.max()
+    return float(statistics.median(y[tall].tolist())), float(statistics.median(heights[tall].tolist()))
+
+
+def _cut(ink, pieces):
+    # columns splitting a run of glyphs into pieces, where there's the least ink
+    if pieces == 1:
+        return [0, ink.shape[1]]
+    profile = ink.sum(axis=0)
+    width = ink.shape[1] / pieces
+    cuts = [0]
+    for i in range(1, pieces):
+        lo, hi = int((i - 0.3) * width), int((i + 0.3) * width) + 1
+        cuts.append(lo + int(numpy.argmin(profile[lo:hi])))
+    cuts.append(ink.shape[1])
+    return cuts
+
+
+def segment(img):
+    # the glyph cells of a prepped (black on white) footer line, left to right, as
+    # rows of a float32 array, and whether a space comes before each glyph. Ink
+    # touching the edge of the strip (frame, card edge) is left out.
+    small = numpy.ascontiguousarray(img[::_subsample, ::_subsample])
+    _, ink = cv2.threshold(small, 127, 1, cv2.THRESH_BINARY_INV)
+    # the outlines of the blobs of ink give their boxes for a fraction of what
+    # connectedComponentsWithStats takes
+    contours, _ = cv2.findContours(ink, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    h, w = ink.shape
+    boxes = numpy.array([cv2.boundingRect(contour) for contour in contours], numpy.int32).reshape(-1, 4)
+    x, y, cw, ch = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    blobs = numpy.flatnonzero((x > 0) & (y > 0) & (x + cw < w) & (y + ch < h))
+    if len(blobs) == 0:
+        return numpy.empty((0, _cell_pixels), numpy.float32), []
+    top, letter_height = _letter_band(y[blobs], ch[blobs])
+    middle = y[blobs] + ch[blobs] / 2
+    keep = (numpy.maximum(cw[blobs], ch[blobs]) >= _min_speck * letter_height) & \
+        (middle > top - 0.5 * letter_height) & (middle < top + 1.5 * letter_height)
+    blobs = blobs[keep]
+
+    # blobs overlapping by more than half the narrower one are one glyph, each
+    # glyph's blobs are filled with its number and masked with the ink (for the holes)
+    glyphs = []     # [left, right]
+    glyph_map = numpy.zeros_like(ink)
+    blobs = blobs[numpy.argsort(x[blobs], kind='stable')]
+    for i, left, right in zip(blobs.tolist(), x[blobs].tolist(), (x[blobs] + cw[blobs]).tolist()):
+        previous = glyphs[-1] if glyphs else None
+        if previous is not None and min(right, previous[1]) - max(left, previous[0]) > \
+                0.5 * min(right - left, previous[1] - previous[0]):
+            previous[0], previous[1] = min(left, previous[0]), max(right, previous[1])
+        else:
+            glyphs.append([left, right])
+        cv2.drawContours(glyph_map, contours[i:i + 1], 0, len(glyphs), cv2.FILLED)
+
+    scale = _cell_letter_height / letter_height
+    row0 = max(0, int(round(top - _cell_letter_top / scale)))
+    row1 = min(h, int(round(top + (_cell_size[1] - _cell_letter_top) / scale)))
+    offset = row0 - (top - _cell_letter_top / scale)
+    band = glyph_map[row0:row1] * ink[row0:row1]
+    pieces = []     # (glyph number, left, right)
+    for number, (left, right) in enumerate(glyphs, 1):
+        if right - left > _max_glyph_width * letter_height:
+            count = max(2, int(round((right - left) / (_glyph_width * letter_height))))
+            cuts = _cut(band[:, left:right] == number, count)
+            pieces.extend((number, left + cuts[i], left + cuts[i + 1]) for i in range(count))
+        else:
+            pieces.append((number, left, right))
+    # every cell is written in place, the rows of band all scale to the same height and top
+    cells = numpy.zeros((len(pieces),) + _cell_size[::-1], numpy.float32)
+    height = min(_cell_size[1], max(1, int(round((row1 - row0) * scale))))
+    top = min(_cell_size[1] - height, max(0, int(round(offset * scale))))
+    spaces = []
+    previous_right = None
+    for cell, (number, left, right) in zip(cells, pieces):
+        spaces.append(previous_right is not None and left - previous_right > _space_width * letter_height)
+        previous_right = right
+        width = min(_cell_size[0], max(1, int(round((right - left) * scale))))
+        column = (_cell_size[0] - width) // 2
+        piece = (band[:, left:right] == number).astype(numpy.float32)
+        cell[top:top + height, column:column + width] = cv2.resize(piece, (width, height),
+            interpolation=cv2.INTER_AREA)
+    return cells.reshape(-1, _cell_pixels), spaces
+
+
+class GlyphBank:
+    def __init__(self, cells, labels):
+        self.cells = numpy.asarray(cells, numpy.float32).reshape(-1, _cell_pixels)
+        self.labels = numpy.array(labels, dtype=str)
+        self._norms = (self.cells ** 2).sum(axis=1)
+
+
+    def __len__(self):
+        return len(self.labels)
+
+
+    @classmethod
+    def build(cls, labels_fn):
+        # labels_fn has IMAGE<tab>TEXT lines, IMAGE (relative to labels_fn) a prepped
+        # footer line as --debug-images writes them (dbg-7-cnc-5-threshold.png,
+        # dbg-6-set-5-threshold.png) and TEXT what it says, e.g. "199/269 M"
+        directory = os.path.dirname(labels_fn)
+        cells, labels = [], []
+        lines = 0
+        with open(labels_fn, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                fields = line.rstrip('\r\n').split('\t')
+                if not fields[0].strip():
+                    continue
+                if len(fields) != 2:
+                    logging.warning(f'Skipping line {number} of <{labels_fn}>, expected IMAGE<tab>TEXT')
+                    continue
+                fn, text = fields
+                img = cv2.imread(os.path.join(directory, fn), cv2.IMREAD_GRAYSCALE)
+                if img is None:
+                    logging.warning(f'Unable to read image <{fn}>')
+                    continue
+                line_cells, _ = segment(img)
+                chars = [c for c in text if not c.isspace()]
+                if len(chars) != len(line_cells):
+                    logging.warning(f'Skipping <{fn}>, {len(line_cells)} glyphs found for '
+                        f'the {len(chars)} characters of <{text}>')
+                    continue
+                lines += 1
+                for cell, char in zip(line_cells, chars):
+                    if not _is_duplicate(cell, char, cells, labels):
+                        cells.append(cell)
+                        labels.append(char)
+        logging.info(f'{len(labels)} glyph samples of {len(set(labels))} characters from {lines} lines')
+        return cls(cells, labels)
+
+
+    def save(self, fn):
+        with open(fn, 'wb') as f:
+            numpy.savez_compressed(f, cells=numpy.round(self.cells * 255).astype(numpy.uint8),
+                labels=self.labels, cell_size=numpy.array(_cell_size))
+
+
+    @classmethod
+    def load(cls, fn):
+        with numpy.load(fn) as data:
+            if tuple(data['cell_size']) != _cell_size:
+                raise ValueError(f'Glyph bank <{fn}> has {tuple(data["cell_size"])} cells, '
+                    f'expected {_cell_size}, build it again')
+            return cls(data['cells'].astype(numpy.float32) / 255, data['labels'])
+
+
+    def classify(self, cells):
+        # the label of the nearest sample to each cell, its mean squared difference
+        # and how much further the nearest sample of another label is, all cells
+        # against all samples at once
+        distances = self._norms[None, :] - 2 * (cells @ self.cells.T) + (cells ** 2).sum(axis=1)[:, None]
+        distances = numpy.maximum(distances, 0) / _cell_pixels
+        best = numpy.argmin(distances, axis=1)
+        labels = self.labels[best]
+        others = numpy.where(self.labels[None, :] != labels[:, None], distances, numpy.inf)
+        nearest = distances[numpy.arange(len(cells)), best]
+        return labels, nearest, numpy.minimum(others.min(axis=1) - nearest, 1)
+
+
+    def read_line(self, img):
+        # the text of a prepped footer line, None when there's nothing on it or a
+        # glyph isn't like any sample
+        cells, spaces = segment(img)
+        if len(cells) == 0 or len(self) == 0:
+            return None
+        labels, distances, margins = self.classify(cells)
+        text = ''.join((' ' if space else '') + label for label, space in zip(labels, spaces))
+        if distances.max() > _max_distance or margins.min() < _min_margin:
+            logging.info(f'glyphs: unsure of {ascii(text)}, distance {distances.max():.3f} '
+                f'margin {margins.min():.3f}')
+            return None
+        return text
+
+
+def _is_duplicate(cell, char, cells, labels):
+    same = [c for c, label in zip(cells, labels) if label == char]
+    if not same:
+        return False
+    return float(((numpy.array(same) - cell) ** 2).mean(axis=1).min()) < _duplicate_distance
+
+
+# banks loaded in this process, by file name
+_banks = {}
+
+
+def get_bank(fn):
+    if fn not in _banks:
+        _banks[fn] = GlyphBank.load(fn)
+        logging.info(f'loaded {len(_banks[fn])} glyph samples from {fn}')
+    return _banks[fn]
@@ -0,0 +1,77 @@
+import hashlib
+import json
+import logging
+import os
+import time
+
+_read_size = 1024 * 1024
+
+
+def file_digest(fn):
+    h = hashlib.sha256()
+    with open(fn, 'rb') as f:
+        while True:
+            chunk = f.read(_read_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class Journal:
+    # Append only json lines, one per image once it has been recognized and
+    # canonicalized, keyed by the sha256 of the image file. The raw OCR fields are
+    # kept too so a card Scryfall couldn't resolve only needs canonicalizing again.
+    # A later line for the same image wins, a line cut short by a crash is skipped.
+    def __init__(self, fn):
+        self.fn = fn
+        self.entries = {}
+        if os.path.exists(fn):
+            self._load()
+        self._file = open(fn, 'a', encoding='utf-8')
+        if self._file.tell() > 0 and not self._ends_with_newline():
+            self._file.write('\n')
+
+
+    def _load(self):
+        with open(self.fn, encoding='utf-8') as f:
+            for number, line in enumerate(f, 1):
+                if not line.strip():
+                    continue
+                try:
+                    entry = json.loads(line)
+                    self.entries[entry["sha256"]] = entry
+                except (ValueError, KeyError, TypeError):
+                    logging.warning(f'Skipping unreadable line {number} of journal <{self.fn}>')
+        logging.info(f'journal {self.fn}: {len(self.entries)} images')
+
+
+    def _ends_with_newline(self):
+        with open(self.fn, 'rb') as f:
+            f.seek(-1, os.SEEK_END)
+            return f.read(1) == b'\n'
+
+
+    def close(self):
+        self._file.close()
+
+
+    def get(self, digest):
+        return self.entries.get(digest)
+
+
+    def record(self, digest, image, record, result):
+        # record is the (title, set_code, collector_number) read, result canonicalize_batch's (match, card)
+        title, set_code, collector_number = record
+        match, card = result
+        entry = {"sha256": digest, "image": image, "title": title, "set_code": set_code,
+            "collector_number": collector_number, "match": match, "card": card, "time": time.time()}
+        self._file.write(json.dumps(entry) + '\n')
+        self._file.flush()
+        self.entries[digest] = entry
+
+
+def is_resolved(entry):
+    # Scryfall found the printing, not just the card's name ("fuzzy-title") or nothing
+    # at all, those are canonicalized again on --resume
+    return entry["match"] is True or entry["match"] == "fuzzy-title-set"
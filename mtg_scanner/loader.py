@@ -0,0 +1,124 @@
+import logging
+import struct
+
+import cv2
+import numpy
+
+from mtg_scanner.localize import MM_CARD_HEIGHT
+
+# resolution the recognizer wants at least, jpeg scans finer than a multiple of
+# this are decoded at reduced size (a 1200 dpi scan decodes at 600 dpi)
+DEFAULT_MIN_DPI = 500
+
+_reduced_flags = ((8, cv2.IMREAD_REDUCED_COLOR_8), (4, cv2.IMREAD_REDUCED_COLOR_4),
+    (2, cv2.IMREAD_REDUCED_COLOR_2))
+_pnm_magics = (b'P5', b'P6')
+
+
+def _jpeg_size(f):
+    f.seek(0)
+    if f.read(2) != b'\xff\xd8':
+        return None
+    while True:
+        marker = f.read(2)
+        if len(marker) < 2 or marker[0] != 0xff:
+            return None
+        if marker[1] in (0xd8, 0x01) or 0xd0 <= marker[1] <= 0xd7:
+            continue
+        length = struct.unpack('>H', f.read(2))[0]
+        if length < 2:
+            return None
+        # SOFn frames, but not DHT (c4), JPG (c8) or DAC (cc)
+        if 0xc0 <= marker[1] <= 0xcf and marker[1] not in (0xc4, 0xc8, 0xcc):
+            height, width = struct.unpack('>xHH', f.read(5))
+            return width, height
+        f.seek(length - 2, 1)
+
+
+def _read_pnm_header(f):
+    # returns (magic, width, height, maxval, offset of the pixel data) or None
+    f.seek(0)
+    magic = f.read(2)
+    if magic not in _pnm_magics:
+        return None
+    fields = []
+    token = b''
+    while len(fields) < 3:
+        ch = f.read(1)
+        if not ch:
+            return None
+        if ch == b'#':
+            f.readline()
+        elif ch.isspace():
+            if token:
+                fields.append(int(token))
+                token = b''
+        else:
+            token += ch
+    # exactly one whitespace byte separates maxval from the pixels, already consumed
+    return magic, fields[0], fields[1], fields[2], f.tell()
+
+
+def _pnm_header(fn):
+    # a malformed header isn't ours to report, OpenCV gets to try the file
+    with open(fn, 'rb') as f:
+        try:
+            return _read_pnm_header(f)
+        except ValueError:
+            return None
+
+
+def _reduced_decode_flags(fn, min_dpi):
+    # libjpeg can scale by 1/2, 1/4 or 1/8 while decoding, skipping most of the
+    # IDCT work. Other formats are decoded in full by the reduced modes anyway so
+    # they gain nothing.
+    with open(fn, 'rb') as f:
+        try:
+            size = _jpeg_size(f)
+        except struct.error:
+            # cut short in the headers, the plain decode reports it
+            size = None
+    if size is None or not min_dpi:
+        return cv2.IMREAD_COLOR
+
+    # the card fills the image height, pick the biggest reduction that keeps min_dpi
+    dpi = size[1] / MM_CARD_HEIGHT * 25.4
+    for factor, reduced in _reduced_flags:
+        if dpi / factor >= min_dpi:
+            logging.info(f'decoding {fn} at 1/{factor} scale ({dpi:.0f} dpi scan)')
+            return reduced
+    return cv2.IMREAD_COLOR
+
+
+def _map_pnm(fn, pnm):
+    # memory map the pixels and hand back a BGR view, StraightCard only touches
+    # the rows of its three strips so only those pages are ever read from disk
+    magic, width, height, maxval, offset = pnm
+    if maxval > 255:
+        return None
+    channels = 3 if magic == b'P6' else 1
+    pixels = numpy.memmap(fn, dtype=numpy.uint8, mode='r', offset=offset, shape=(height, width, channels))
+    if channels == 1:
+        return numpy.broadcast_to(pixels, (height, width, 3))
+    return pixels[:, :, ::-1]
+
+
+def load_card_image(fn, min_dpi=DEFAULT_MIN_DPI):
+    # None when the file can't be read as an image, like cv2.imread
+    try:
+        pnm = _pnm_header(fn)
+        flags = _reduced_decode_flags(fn, min_dpi) if pnm is None else cv2.IMREAD_COLOR
+    except OSError:
+        logging.debug(f'cannot open {fn}', exc_info=True)
+        return None
+    if pnm is not None:
+        try:
+            img = _map_pnm(fn, pnm)
+        except ValueError:
+            # truncated file, let OpenCV make what it can of it
+            img = None
+        if img is not None:
+            logging.info(f'mapped {fn} {img.shape}')
+            return img
+
+    return cv2.imread(fn, flags)
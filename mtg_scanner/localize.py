@@ -0,0 +1,148 @@
+import logging
+
+import cv2
+import numpy
+
+# we're expecting a 88mm x 63mm card in the correct orientation
+MM_CARD_HEIGHT = 88
+MM_CARD_WIDTH = 63
+
+# rows the card is looked for in, the scan is subsampled down to about this
+_localize_height = 400
+# the card has to cover this much of the scan and be this close to the card's aspect
+_min_card_area = 0.4
+_max_aspect_error = 0.03
+# corners this close to the scan's corners (fraction of its size) mean the card
+# already fills the scan, as StraightCard has always assumed
+_fills_image_tolerance = 0.015
+# a region surrounded by an even band no wider than this (mm, at the region's
+# scale) is the light frame inside a full-bleed card's own printed border
+_max_border_mm = 4.5
+_border_evenness_mm = 1.5
+# extra source pixels read around each strip so interpolation has neighbours
+_strip_margin = 2
+
+
+def _translation(x, y):
+    return numpy.array([[1, 0, x], [0, 1, y], [0, 0, 1]], dtype=numpy.float64)
+
+
+def _order_corners(points):
+    # top left, top right, bottom right, bottom left of a roughly upright quad
+    total = points.sum(axis=1)
+    difference = points[:, 1] - points[:, 0]
+    return numpy.array([points[numpy.argmin(total)], points[numpy.argmin(difference)],
+        points[numpy.argmax(total)], points[numpy.argmax(difference)]], dtype=numpy.float32)
+
+
+def _is_card_border(corners, w, h):
+    # Scanner background around a card is as wide as it happens to be on each side,
+    # a card's printed border is a few mm and the same all round. Otsu can't tell a
+    # black border from a dark background, so on a full-bleed scan the light frame
+    # inside the border comes out as the card.
+    insets = numpy.array([min(corners[0, 1], corners[1, 1]), h - max(corners[2, 1], corners[3, 1]),
+        min(corners[0, 0], corners[3, 0]), w - max(corners[1, 0], corners[2, 0])])
+    px_per_mm = (corners[3, 1] - corners[0, 1] + corners[2, 1] - corners[1, 1]) / 2 / MM_CARD_HEIGHT
+    insets_mm = insets / px_per_mm
+    return insets_mm.max() <= _max_border_mm and insets_mm.max() - insets_mm.min() <= _border_evenness_mm
+
+
+def find_card_quad(img):
+    # corners of the card in img (tl, tr, br, bl) or None when the card fills
+    # the image or can't be told from the background. Only every step-th pixel is
+    # looked at, so a memory mapped scan is mostly left on disk.
+    h, w = img.shape[:2]
+    step = max(1, h // _localize_height)
+    small = cv2.cvtColor(numpy.ascontiguousarray(img[::step, ::step]), cv2.COLOR_BGR2GRAY)
+    small = cv2.GaussianBlur(small, (5, 5), 0)
+
+    # the scanner background is whatever the edge of the scan is, the card is the other side of Otsu
+    edge = numpy.concatenate([small[0], small[-1], small[:, 0], small[:, -1]])
+    threshold, mask = cv2.threshold(small, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    if numpy.median(edge) > threshold:
+        mask = cv2.bitwise_not(mask)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, numpy.ones((5, 5), numpy.uint8))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    if not contours:
+        return None
+    contour = max(contours, key=cv2.contourArea)
+    (cx, cy), (rw, rh), angle = cv2.minAreaRect(contour)
+    if rw * rh < _min_card_area * small.shape[0] * small.shape[1]:
+        logging.info('localize: no card sized region found')
+        return None
+    aspect = min(rw, rh) / max(rw, rh)
+    if abs(aspect - MM_CARD_WIDTH / MM_CARD_HEIGHT) > _max_aspect_error:
+        logging.info(f'localize: card region aspect {aspect:.3f} is not a card')
+        return None
+
+    corners = _order_corners(cv2.boxPoints(((cx, cy), (rw, rh), angle))) * step
+    if corners[1, 0] - corners[0, 0] > corners[3, 1] - corners[0, 1]:
+        logging.info('localize: card is on its side')
+        return None
+    image_corners = numpy.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=numpy.float32)
+    if (numpy.abs(corners - image_corners) <= _fills_image_tolerance * numpy.array([w, h])).all():
+        return None
+    if _is_card_border(corners, w, h):
+        logging.info('localize: region is inside the card\'s border, the card fills the scan')
+        return None
+    logging.info(f'localize: card at {corners.tolist()}')
+    return corners
+
+
+class CardFrame:
+    # where the card is in a scan, rects in mm on the card map to pixels in it. With
+    # no quad the card fills the scan, otherwise each strip is cut out through one
+    # perspective warp of just its own neighbourhood, never the whole scan.
+    def __init__(self, img, quad=None):
+        self.image = img
+        self.quad = quad
+        if quad is None:
+            self.px_per_mm = img.shape[0] / MM_CARD_HEIGHT
+            self.to_image = None
+        else:
+            left = numpy.linalg.norm(quad[3] - quad[0])
+            right = numpy.linalg.norm(quad[2] - quad[1])
+            self.px_per_mm = (left + right) / 2 / MM_CARD_HEIGHT
+            w, h = MM_CARD_WIDTH * self.px_per_mm, MM_CARD_HEIGHT * self.px_per_mm
+            card = numpy.array([[0, 0], [w, 0], [w, h], [0, h]], dtype=numpy.float32)
+            self.to_image = cv2.getPerspectiveTransform(card, quad)
+
+
+    def px_rect(self, rect):
+        return tuple(int(v * self.px_per_mm) for v in rect)
+
+
+    def crop_shape(self, rect):
+        # shape of what crop(rect) returns, it's cut short where rect runs off the image
+        x, y, w, h = self.px_rect(rect)
+        if self.to_image is None:
+            return self.image[y:y+h, x:x+w].shape
+        return (h, w) + self.image.shape[2:]
+
+
+    def crop(self, rect, out=None):
+        # copy of the strip at rect (mm), upright and at the scan's resolution, written
+        # to out (shaped crop_shape(rect)) when it's given
+        x, y, w, h = self.px_rect(rect)
+        if self.to_image is None:
+            if out is None:
+                return self.image[y:y+h, x:x+w].copy()
+            numpy.copyto(out, self.image[y:y+h, x:x+w])
+            return out
+
+        strip_to_image = self.to_image @ _translation(x, y)
+        corners = cv2.perspectiveTransform(
+            numpy.array([[[0, 0], [w, 0], [w, h], [0, h]]], dtype=numpy.float64), strip_to_image)[0]
+        ih, iw = self.image.shape[:2]
+        left, top = numpy.maximum(numpy.floor(corners.min(axis=0)).astype(int) - _strip_margin, 0)
+        right, bottom = numpy.ceil(corners.max(axis=0)).astype(int) + _strip_margin
+        right, bottom = min(right, iw), min(bottom, ih)
+        # a small contiguous copy, the scan itself may be a memory map or a reversed view
+        source = self.image[top:bottom, left:right].copy()
+        return cv2.warpPerspective(source, _translation(-left, -top) @ strip_to_image, (w, h), dst=out,
+            flags=cv2.INTER_LINEAR | cv2.WARP_INVERSE_MAP, borderMode=cv2.BORDER_REPLICATE)
+
+
+def locate_card(img):
+    return CardFrame(img, find_card_quad(img))
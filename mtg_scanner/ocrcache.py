@@ -0,0 +1,233 @@
+import atexit
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+import cv2
+import numpy
+
+from mtg_scanner import profiling
+from mtg_scanner.cache import user_cache_dir
+from mtg_scanner.hashes import hamming
+
+_default_max_entries = 50000
+_evict_interval = 100          # check the size limit every n stores
+_touch_batch = 100             # write access times every n hits
+_initial_rows = 256
+
+# hash grid (columns, rows) each prepped line is reduced to, per kind of read
+_hash_sizes = {'title': (128, 16), 'footer': (64, 16)}
+
+# fraction of the hash bits that may differ for a lookup to count as the same
+# crop. Titles of different cards are far apart, but the footers of two cards in
+# one set differ by a digit or so, about as much as two scans of the same footer,
+# so footers only reuse an exactly matching hash (e.g. the same scans run again).
+_max_distance = {'title': 0.08, 'footer': 0.0}
+
+# ink in an outer percent of the line at either end is ignored when finding its extent
+_ink_trim = 0.01
+
+
+def _ink_span(profile):
+    cumulative = numpy.cumsum(profile)
+    total = cumulative[-1]
+    return (int(numpy.searchsorted(cumulative, total * _ink_trim)),
+        int(numpy.searchsorted(cumulative, total * (1 - _ink_trim))) + 1)
+
+
+class _Entries:
+    # the results of one kind of read. The hashes are rows of a matrix with room
+    # to spare, doubled when full, so a store doesn't copy all of them
+    def __init__(self, width, capacity=_initial_rows):
+        self.ids = []
+        self.values = []
+        self._hashes = numpy.empty((max(capacity, _initial_rows), width), numpy.uint8)
+
+
+    def __len__(self):
+        return len(self.ids)
+
+
+    @property
+    def hashes(self):
+        return self._hashes[:len(self.ids)]
+
+
+    def append(self, row_id, digest, value):
+        n = len(self.ids)
+        if n == len(self._hashes):
+            grown = numpy.empty((2 * n, self._hashes.shape[1]), numpy.uint8)
+            grown[:n] = self._hashes
+            self._hashes = grown
+        self._hashes[n] = digest
+        self.ids.append(row_id)
+        self.values.append(value)
+
+
+    def extend(self, ids, digests, values):
+        # rows as loaded from the database, into a matrix made with room for them
+        n = len(self.ids)
+        self._hashes[n:n + len(ids)] = numpy.frombuffer(b''.join(digests), numpy.uint8).reshape(len(ids), -1)
+        self.ids.extend(ids)
+        self.values.extend(values)
+
+
+def line_hash(img, size):
+    # perceptual hash of a prepped (black on white) line. Ink touching the edge of
+    # the strip (frame, card edge) is dropped and the rest cropped to its extent
+    # before it is shrunk to the grid, so a card hashes the same wherever it sat on
+    # the scanner
+    ink = (img < 128).astype(numpy.uint8)
+    count, labels, stats, _ = cv2.connectedComponentsWithStats(ink, connectivity=8)
+    h, w = ink.shape
+    x, y, cw, ch = stats[:, 0], stats[:, 1], stats[:, 2], stats[:, 3]
+    inside = (x > 0) & (y > 0) & (x + cw < w) & (y + ch < h)
+    inside[0] = False   # the background
+    ink = inside[labels]
+    if ink.any():
+        top, bottom = _ink_span(ink.sum(axis=1))
+        left, right = _ink_span(ink.sum(axis=0))
+        ink = ink[top:bottom, left:right]
+    small = cv2.resize(ink.astype(numpy.uint8) * 255, size, interpolation=cv2.INTER_AREA)
+    return numpy.packbits(small >= 128)
+
+
+class OcrCache:
+    # OCR results keyed by the perceptual hash of the prepped line images, kept in
+    # sqlite so a box of the same commons is only read once, ever. Each process
+    # loads the hashes for its engine and recognizer version (card.READ_VERSION)
+    # into memory and compares against all of them at once.
+    def __init__(self, engine, version, fn=None, max_entries=_default_max_entries):
+        if fn is None:
+            os.makedirs(user_cache_dir(), exist_ok=True)
+            fn = os.path.join(user_cache_dir(), 'ocr.sqlite')
+        self.fn = fn
+        # results of another version are left for eviction to clear out
+        self.engine = f'{engine}/v{version}'
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._stores = 0
+        self._touched = {}    # row id -> access time not yet written
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(fn, timeout=30, check_same_thread=False)
+        # several recognizer processes share the file
+        self._db.execute('PRAGMA journal_mode=WAL')
+        self._db.execute('PRAGMA synchronous=NORMAL')
+        self._db.execute('''CREATE TABLE IF NOT EXISTS results (
+            id INTEGER PRIMARY KEY,
+            engine TEXT,
+            kind TEXT,
+            hash BLOB,
+            value TEXT,
+            accessed_at REAL)''')
+        self._db.execute('CREATE INDEX IF NOT EXISTS results_accessed ON results (accessed_at)')
+        self._db.commit()
+        self._load()
+
+
+    def close(self):
+        with self._lock:
+            self._write_access_times()
+            self._db.commit()
+            self._db.close()
+
+
+    def flush(self):
+        with self._lock:
+            self._write_access_times()
+            self._db.commit()
+
+
+    def stats(self):
+        return {"hits": self.hits, "misses": self.misses}
+
+
+    def _load(self):
+        # kind -> _Entries
+        rows = {}
+        for row_id, kind, digest, value in self._db.execute(
+                'SELECT id, kind, hash, value FROM results WHERE engine = ?', (self.engine,)):
+            rows.setdefault(kind, []).append((row_id, digest, value))
+        self._index = {}
+        for kind, entries in rows.items():
+            ids, digests, values = zip(*entries)
+            self._index[kind] = _Entries(len(digests[0]), 2 * len(entries))
+            self._index[kind].extend(ids, digests, values)
+
+
+    def _write_access_times(self):
+        # caller holds the lock and commits. Hits only note the time, it is written
+        # a batch at a time; the ones not yet written when a worker process exits
+        # are lost, which only makes eviction a little less exact
+        if self._touched:
+            self._db.executemany('UPDATE results SET accessed_at = ? WHERE id = ?',
+                [(accessed_at, row_id) for row_id, accessed_at in self._touched.items()])
+            self._touched.clear()
+
+
+    def key(self, kind, *lines):
+        size = _hash_sizes[kind]
+        return numpy.concatenate([line_hash(line, size) for line in lines])
+
+
+    def get(self, kind, key):
+        # the value stored for the nearest hash within tolerance, or None
+        with self._lock:
+            index = self._index.get(kind)
+            if index and index.hashes.shape[1] == key.size:
+                distances = hamming(index.hashes, key)
+                best = int(numpy.argmin(distances))
+                if distances[best] <= _max_distance[kind] * key.size * 8:
+                    self.hits += 1
+                    profiling.incr('ocr_cache_hits')
+                    self._touched[index.ids[best]] = time.time()
+                    if len(self._touched) >= _touch_batch:
+                        self._write_access_times()
+                        self._db.commit()
+                    return json.loads(index.values[best])
+            self.misses += 1
+            profiling.incr('ocr_cache_misses')
+            return None
+
+
+    def put(self, kind, key, value):
+        value = json.dumps(value)
+        with self._lock:
+            cursor = self._db.execute('INSERT INTO results (engine, kind, hash, value, accessed_at) '
+                'VALUES (?, ?, ?, ?, ?)', (self.engine, kind, key.tobytes(), value, time.time()))
+            # pending access times go out with the store's commit
+            self._write_access_times()
+            self._db.commit()
+            if kind not in self._index:
+                self._index[kind] = _Entries(key.size)
+            self._index[kind].append(cursor.lastrowid, key, value)
+            self._stores += 1
+            if self._stores % _evict_interval == 0:
+                self._evict()
+
+
+    def _evict(self):
+        # caller holds the lock, access times are written by put first
+        total = self._db.execute('SELECT COUNT(*) FROM results').fetchone()[0]
+        if total <= self.max_entries:
+            return
+        self._db.execute('DELETE FROM results WHERE id IN '
+            '(SELECT id FROM results ORDER BY accessed_at LIMIT ?)', (total - self.max_entries,))
+        self._db.commit()
+        logging.info(f'ocr cache: evicted {total - self.max_entries} results')
+        self._load()
+
+
+# one cache per engine and version per process (each --jobs worker gets its own connection)
+_ocr_caches = {}
+
+
+def get_ocr_cache(engine, version):
+    if (engine, version) not in _ocr_caches:
+        _ocr_caches[engine, version] = OcrCache(engine, version)
+        atexit.register(_ocr_caches[engine, version].flush)
+    return _ocr_caches[engine, version]
@@ -0,0 +1,155 @@
+import contextlib
+import contextvars
+import functools
+import json
+import threading
+import time
+
+# --profile support. While an image is recognized (in whichever process does it)
+# or a batch is canonicalized there is a current Profile for that thread (a
+# context variable, so threads recognizing images side by side each add to their
+# own), the code deep in card, client and cache just calls stage() and incr()
+# which do nothing when no profile is being recorded. Profiles pickle, so workers
+# hand them back along with what they recognized.
+
+_lock = threading.Lock()
+_current = contextvars.ContextVar('profile', default=None)
+
+_percentiles = (50, 90, 99)
+
+
+class Profile:
+    def __init__(self, **labels):
+        # labels say what was profiled, e.g. image=fn or batch=75
+        self.labels = labels
+        self.started = time.perf_counter()
+        self.wall = None
+        self.stages = {}    # stage name -> seconds for each time it ran
+        self.counters = {}
+
+
+    def add_time(self, stage, seconds):
+        with _lock:
+            self.stages.setdefault(stage, []).append(seconds)
+
+
+    def incr(self, counter, n=1):
+        with _lock:
+            self.counters[counter] = self.counters.get(counter, 0) + int(n)
+
+
+    def finish(self):
+        self.wall = time.perf_counter() - self.started
+
+
+    def to_json(self):
+        stages = {stage: {"calls": len(times), "ms": _ms(sum(times))} for stage, times in self.stages.items()}
+        return dict(self.labels, wall_ms=_ms(self.wall), stages=stages, counters=self.counters)
+
+
+def _ms(seconds):
+    return round(seconds * 1000, 3)
+
+
+def _spread(seconds):
+    import numpy    # only for run summaries, keeps `mtg-scan canonicalize` from loading it
+    values = numpy.percentile(numpy.array(seconds) * 1000, _percentiles)
+    spread = {f'p{p}': round(float(v), 3) for p, v in zip(_percentiles, values)}
+    spread['max'] = _ms(max(seconds))
+    return spread
+
+
+class RunSummary:
+    # percentiles over every profile of the run, per kind (image or batch)
+    def __init__(self):
+        self.walls = {}
+        self.stage_calls = {}     # stage name -> seconds of every call
+        self.stage_totals = {}    # (kind, stage name) -> seconds per profile
+        self.counters = {}
+
+
+    def add(self, profile):
+        kind = next(iter(profile.labels), 'run')
+        self.walls.setdefault(kind, []).append(profile.wall)
+        for stage, times in profile.stages.items():
+            self.stage_calls.setdefault(stage, []).extend(times)
+            self.stage_totals.setdefault((kind, stage), []).append(sum(times))
+        for counter, n in profile.counters.items():
+            self.counters[counter] = self.counters.get(counter, 0) + int(n)
+
+
+    def to_json(self):
+        kinds = {}
+        for kind, walls in self.walls.items():
+            kinds[kind] = {"count": len(walls), "wall_ms": _spread(walls), "stages": {
+                stage: _spread(times) for (k, stage), times in self.stage_totals.items() if k == kind}}
+        calls = {stage: dict(calls=len(times), ms=_ms(sum(times)), **_spread(times))
+            for stage, times in self.stage_calls.items()}
+        # hit rate of each cache, from its <name>_hits and <name>_misses counters
+        rates = {}
+        for counter, hits in self.counters.items():
+            if counter.endswith('_hits'):
+                name = counter[:-len('_hits')]
+                lookups = hits + self.counters.get(f'{name}_misses', 0)
+                rates[f'{name}_hit_rate'] = round(hits / lookups, 4) if lookups else None
+        return {"summary": dict(kinds, calls=calls, counters=self.counters, rates=rates)}
+
+
+@contextlib.contextmanager
+def recording(profile):
+    # make profile the current one for the block, None leaves things as they are
+    if profile is None:
+        yield None
+        return
+    token = _current.set(profile)
+    try:
+        yield profile
+    finally:
+        _current.reset(token)
+        profile.finish()
+
+
+@contextlib.contextmanager
+def stage(name):
+    profile = _current.get()
+    if profile is None:
+        yield
+        return
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        profile.add_time(name, time.perf_counter() - start)
+
+
+def timed(name):
+    # decorator form of stage()
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            with stage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def carry(fn):
+    # fn to run on another thread (e.g. a pool's) with the caller's current
+    # profile, each call gets its own copy of the caller's context
+    context = contextvars.copy_context()
+
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        return context.copy().run(fn, *args, **kwargs)
+    return wrapper
+
+
+def incr(counter, n=1):
+    profile = _current.get()
+    if profile is not None:
+        profile.incr(counter, n)
+
+
+def write(record, output):
+    print(json.dumps(record.to_json()), file=output)
+    output.flush()
@@ -0,0 +1,171 @@
+import collections
+import logging
+import os
+import signal
+
+import cv2
+import numpy
+from mtg_scanner import card
+from mtg_scanner import debugsink
+from mtg_scanner import fingerprint
+from mtg_scanner import glyphs
+from mtg_scanner import loader
+from mtg_scanner import localize
+from mtg_scanner import ocrcache
+from mtg_scanner import profiling
+from mtg_scanner.catalog import get_catalog
+
+# what the recognizer made of one image, error is set (and the rest empty) when it
+# failed, profile is the image's profiling.Profile when one was asked for
+Recognized = collections.namedtuple('Recognized',
+    ['image', 'title', 'set_code', 'collector_number', 'error', 'profile'], defaults=(None,))
+
+
+def init_worker(log_level, warm=None):
+    logging.basicConfig(format='%(levelname)s\t%(message)s', level=log_level, force=True)
+    # each worker handles one card at a time, keep OpenCV and tesseract from
+    # starting their own thread pools on top of the process pool
+    cv2.setNumThreads(1)
+    os.environ['OMP_THREAD_LIMIT'] = '1'
+    # Ctrl-C is for the main process, it decides what to finish
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    if warm is not None:
+        warm_up(**warm)
+
+
+def warm_up(ocr='auto', ocr_cache=False, fingerprint_index=None, catalog=None, glyph_bank=None, **options):
+    # load what recognize_image would load for its first card (takes the same
+    # options), so a long running process doesn't make its first request wait
+    engine = card.get_ocr_engine(ocr)
+    if ocr_cache:
+        ocrcache.get_ocr_cache(engine.name, card.READ_VERSION)
+    if fingerprint_index:
+        fingerprint.get_index(fingerprint_index)
+    if catalog:
+        get_catalog(catalog)
+    if glyph_bank:
+        glyphs.get_bank(glyph_bank)
+
+
+def recognize_image(img, debug=False, ocr='auto', ocr_cache=False, fingerprint_index=None, catalog=None,
+        localize_card=True, card_images=None, glyph_bank=None):
+    # fingerprint_index is the file name of a fingerprint.FingerprintIndex to try
+    # before OCR, only cards it can't tell apart are read. catalog is the file name
+    # of a Catalog that title reads are checked against. localize_card looks for a
+    # tilted card or one with scanner background around it. card_images is a
+    # debugsink.CardImages for the debug images. glyph_bank is the file name of a
+    # glyphs.GlyphBank the footer is read with, OCR only reads the footers it's unsure of.
+    frame = None
+    if localize_card:
+        with profiling.stage('localize'):
+            frame = localize.locate_card(img)
+        if frame.quad is not None:
+            profiling.incr('cards_localized')
+
+    if fingerprint_index:
+        with profiling.stage('fingerprint'):
+            match = fingerprint.get_index(fingerprint_index).identify(img, frame)
+        if match is not None:
+            profiling.incr('fingerprint_matches')
+            title = match.title
+            if not title and catalog:
+                # a reference named SET_NUMBER only, the catalog knows what it's called
+                known = get_catalog(catalog).lookup_set_number(match.set_code, match.collector_number)
+                title = known["name"] if known is not None else title
+            return title, match.set_code, match.collector_number
+        profiling.incr('fingerprint_fallbacks')
+
+    engine = card.get_ocr_engine(ocr)
+    c = card.StraightCard(img, card_type=None, save_debug_images=debug, ocr=engine,
+        ocr_cache=ocrcache.get_ocr_cache(engine.name, card.READ_VERSION) if ocr_cache else None, frame=frame,
+        debug_images=card_images, glyphs=glyphs.get_bank(glyph_bank) if glyph_bank else None)
+    validate = get_catalog(catalog).lookup_name if catalog else None
+    with profiling.stage('read_title'):
+        title = c.read_title_cascade(validate=validate)
+    with profiling.stage('read_footer'):
+        footer = c.read_footer()
+    return title, footer.set_code, footer.collector_number
+
+
+def _recognize_page(name, img, options):
+    # options are recognize_image's, and debug_images, a (directory, every, failures_only)
+    # for a debugsink.DebugSink
+    logging.info(f'recognizing {name}')
+    options = dict(options)
+    debug_images = options.pop('debug_images', None)
+    card_images = debugsink.get_sink(*debug_images).card(name) if debug_images else None
+    try:
+        title, set_code, collector_number = recognize_image(img, card_images=card_images, **options)
+    except Exception as e:
+        logging.debug('recognizer failed', exc_info=True)
+        if card_images is not None:
+            card_images.finish(failed=True, card_image=img)
+        return Recognized(name, None, None, None, f'Unable to recognize <{name}>: {e}')
+    logging.info(f'Recognizer returned: {title} ({set_code}) {collector_number}')
+    if card_images is not None:
+        card_images.finish(failed=not (title and set_code and collector_number), card_image=img)
+    return Recognized(name, title, set_code, collector_number, None)
+
+
+def recognize_page(page, profile=False, **options):
+    # page is a (name, BGR image) pair, e.g. from scanner.scan_pages, options are
+    # recognize_image's
+    name, img = page
+    with profiling.recording(profiling.Profile(image=name) if profile else None) as p:
+        r = _recognize_page(name, img, options)
+    return r._replace(profile=p)
+
+
+def recognize_file(fn, min_dpi=loader.DEFAULT_MIN_DPI, profile=False, **options):
+    with profiling.recording(profiling.Profile(image=fn) if profile else None) as p:
+        logging.info(f'reading {fn}')
+        with profiling.stage('load'):
+            img = loader.load_card_image(fn, min_dpi)
+        if img is None:
+            r = Recognized(fn, None, None, None, f'Unable to read image <{fn}>')
+        else:
+            r = _recognize_page(fn, img, options)
+    return r._replace(profile=p)
+
+
+def recognize_bytes(upload, profile=False, **options):
+    # upload is a (name, encoded image file) pair, e.g. the body of a request to the server
+    name, data = upload
+    with profiling.recording(profiling.Profile(image=name) if profile else None) as p:
+        with profiling.stage('load'):
+            img = cv2.imdecode(numpy.frombuffer(data, numpy.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            r = Recognized(name, None, None, None, f'Unable to decode image <{name}>')
+        else:
+            r = _recognize_page(name, img, options)
+    return r._replace(profile=p)
+
+
+def imap(executor, fn, items, ahead):
+    # like executor.map, results in input order, but only keeps `ahead` items in
+    # flight so a generator input (e.g. a scanner) streams instead of being
+    # drained before the first result comes back. A None item is a source that
+    # waits for input (e.g. a watched directory) saying it has nothing yet, the
+    # results already done are yielded and then the None.
+    pending = collections.deque()
+    items = iter(items)
+    while True:
+        try:
+            item = next(items)
+        except StopIteration:
+            break
+        except Exception:
+            # the source failed (e.g. the scanner jammed), what it gave before still counts
+            while pending:
+                yield pending.popleft().result()
+            raise
+        if item is None:
+            while pending and pending[0].done():
+                yield pending.popleft().result()
+            yield None
+            continue
+        pending.append(executor.submit(fn, item))
+        if len(pending) >= ahead:
+            yield pending.popleft().result()
+    while pending:
+        yield pending.popleft().result()
@@ -0,0 +1,115 @@
+import logging
+import os
+import queue
+import threading
+
+import cv2
+import numpy
+
+# pages converted ahead of the recognizer, enough to keep the ADF busy without
+# holding a stack of full resolution pages in memory
+_prefetch_pages = 2
+# seconds without a page before scan_pages says the feeder is idle
+_idle_wait = 1
+_image_extensions = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp')
+
+
+class ScannerError(RuntimeError):
+    # the feeder stopped with an error part way through, the pages before it were scanned
+    pass
+
+
+class FakeDevice:
+    # stands in for a sane device: multi_scan() hands back the images in a
+    # directory as PIL images, in name order, as if they came off the feeder
+    def __init__(self, directory):
+        self.directory = directory
+        self.source = None
+
+
+    def multi_scan(self):
+        from PIL import Image
+
+        for fn in sorted(os.listdir(self.directory)):
+            if fn.lower().endswith(_image_extensions):
+                with Image.open(os.path.join(self.directory, fn)) as im:
+                    im.load()
+                    yield im
+
+
+    def close(self):
+        pass
+
+
+def open_device(device=None, source='ADF Front'):
+    # device is a sane device name, empty for the first one found, or
+    # "fake:DIR" to replay a directory of images
+    if device and device.startswith('fake:'):
+        return FakeDevice(device[len('fake:'):])
+
+    try:
+        import sane
+        import PIL
+    except ImportError as e:
+        raise RuntimeError(f'Scanning needs python-sane and Pillow (pip install mtg-scanner[scanner]): {e}')
+
+    ver = sane.init()
+    logging.info(f'SANE version: {ver}')
+    if not device:
+        devices = sane.get_devices()
+        logging.info(f'Available devices: {devices}')
+        if not devices:
+            raise RuntimeError('No scanners found')
+        device = devices[0][0]
+
+    dev = sane.open(device)
+    for option, value in (('depth', 8), ('mode', 'color'), ('source', source), ('swcrop', 1)):
+        try:
+            setattr(dev, option, value)
+        except Exception:
+            logging.info(f'Cannot set {option} on {device}, using default')
+    return dev
+
+
+def pil_to_bgr(im):
+    if im.mode != 'RGB':
+        im = im.convert('RGB')
+    return cv2.cvtColor(numpy.asarray(im), cv2.COLOR_RGB2BGR)
+
+
+def scan_pages(dev):
+    # generator of (name, BGR image) straight from the feeder. Pages are pulled
+    # and converted on a background thread so the next sheet feeds while the
+    # caller is recognizing this one, and nothing goes through a PNG on disk.
+    # When no page has come for a while it yields None, so the caller can deal
+    # with what it has, like watch.watch_directory.
+    pages = queue.Queue(maxsize=_prefetch_pages)
+    done = object()
+
+    def feed():
+        scanned = 0
+        try:
+            for im in dev.multi_scan():
+                pages.put((f'scan-{scanned + 1:04d}', pil_to_bgr(im)))
+                scanned += 1
+        except Exception as e:
+            logging.debug('scanner failed', exc_info=True)
+            pages.put(ScannerError(f'Scanner stopped after {scanned} pages: {e}'))
+        finally:
+            pages.put(done)
+
+    feeder = threading.Thread(target=feed, name='scanner-feed', daemon=True)
+    feeder.start()
+    while True:
+        try:
+            page = pages.get(timeout=_idle_wait)
+        except queue.Empty:
+            yield None
+            continue
+        if page is done:
+            break
+        if isinstance(page, Exception):
+            raise page
+        logging.info(f'scanned {page[0]}')
+        yield page
+    feeder.join()
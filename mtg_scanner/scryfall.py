@@ -1,51 +1,224 @@
-import requests
 import json
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote_plus
 import logging
+import threading
 
-def canonicalizeCard(title, set_code=None, collector_number=None):
-    logging.info("calling scryfall")
+import requests
+
+from mtg_scanner import profiling
+from mtg_scanner.client import ScryfallClient
+
+_default_workers = 8
+_default_api_base = 'https://api.scryfall.com'
+# most identifiers POST /cards/collection accepts in one call
+_collection_size = 75
+# a local fuzzy match scoring at least this is trusted without asking Scryfall
+_min_fuzzy_score = 0.75
+
+# the base url can be pointed at a local stand-in server
+_api_base = _default_api_base
+# optional offline catalog (see mtg_scanner.catalog), consulted before going to the network
+_catalog = None
+# optional persistent response cache (see mtg_scanner.cache)
+_cache = None
+# shared pooled, rate limited http client, created on first use
+_client = None
+_client_lock = threading.Lock()
+
+
+def set_api_base(url):
+    global _api_base
+    _api_base = url.rstrip('/')
+
+
+def set_catalog(catalog):
+    global _catalog
+    _catalog = catalog
+
+
+def set_cache(cache):
+    global _cache
+    _cache = cache
+
+
+def set_client(client):
+    global _client
+    _client = client
+
+
+def get_client():
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = ScryfallClient()
+        return _client
+
+
+def _fetch(url, headers=None):
+    logging.info(f'GET {url}')
+    response = get_client().get(url, headers=headers)
+    logging.info(f'response.status = {response.status_code}')
+    return response
+
+
+def _get_json(url):
+    # None when there's no card, or Scryfall can't be reached once the client is
+    # done retrying (the card is then reported unresolved rather than ending the run)
+    try:
+        if _cache is not None:
+            status, body = _cache.get(url, _fetch)
+        else:
+            response = _fetch(url)
+            status, body = response.status_code, response.content
+    except requests.RequestException as e:
+        logging.warning(f'GET {url} failed: {e}')
+        return None
+    if status != 200:
+        return None
+    return json.loads(body)
+
+
+def _set_number_url(set_code, collector_number):
+    return f'{_api_base}/cards/{set_code}/{collector_number}'
+
+
+def _known_set_number(set_code, collector_number):
+    # answer a set/number lookup from the catalog or a fresh cache entry, without the network.
+    # A number the catalog doesn't have may be a misread or a card printed after it
+    # was downloaded, only Scryfall can tell.
+    if _catalog is not None:
+        card = _catalog.lookup_set_number(set_code, collector_number)
+        if card is not None:
+            return card
+    if _cache is not None:
+        cached = _cache.peek(_set_number_url(set_code, collector_number))
+        if cached is not None:
+            # an empty card for a remembered 404, so it isn't looked up again
+            return json.loads(cached[1]) if cached[0] == 200 else {}
+    return None
+
+
+def _lookup_set_number(set_code, collector_number):
+    if _catalog is not None:
+        card = _catalog.lookup_set_number(set_code, collector_number)
+        if card is not None:
+            return card
+    return _get_json(_set_number_url(set_code, collector_number))
+
+
+def _lookup_collection(keys):
+    # keys is a list of (set_code, collector_number), returns the cards Scryfall
+    # found keyed the same way, _collection_size identifiers per POST
+    found = {}
+    for start in range(0, len(keys), _collection_size):
+        chunk = keys[start:start + _collection_size]
+        identifiers = [{"set": set_code, "collector_number": collector_number}
+            for set_code, collector_number in chunk]
+        url = f'{_api_base}/cards/collection'
+        logging.info(f'POST {url} ({len(identifiers)} identifiers)')
+        try:
+            response = get_client().post(url, json={"identifiers": identifiers})
+        except requests.RequestException as e:
+            # these cards take the one at a time path instead
+            logging.warning(f'POST {url} failed: {e}')
+            continue
+        logging.info(f'response.status = {response.status_code}')
+        if response.status_code != 200:
+            continue
+        result = response.json()
+        for card in result.get("data", []):
+            if "set" not in card or "collector_number" not in card:
+                continue
+            key = (card["set"].casefold(), card["collector_number"])
+            found[key] = card
+            # remember it as if it had been fetched one at a time
+            if _cache is not None:
+                _cache.put(_set_number_url(*key), json.dumps(card).encode('utf-8'))
+        if _cache is not None:
+            for identifier in result.get("not_found", []):
+                if "set" in identifier and "collector_number" in identifier:
+                    _cache.put(_set_number_url(identifier["set"], identifier["collector_number"]),
+                        b'{}', status=404)
+    return found
+
+
+def _lookup_fuzzy(title):
+    if _catalog is not None:
+        card = _catalog.lookup_name(title)
+        if card is not None:
+            # the catalog has every printing so it can answer the prints query too
+            card["prints"] = _catalog.prints(card["name"])
+            return card
+        matches = _catalog.match_name(title, limit=1)
+        if matches and matches[0][1] >= _min_fuzzy_score:
+            name, score = matches[0]
+            logging.info(f'fuzzy: local match {name} ({score:.2f})')
+            card = _catalog.lookup_name(name)
+            card["prints"] = _catalog.prints(name)
+            return card
+    logging.info('fuzzy: calling scryfall')
+    return _get_json(f'{_api_base}/cards/named?fuzzy={quote_plus(title)}')
+
+
+def _lookup_prints(card):
+    if "prints" in card:
+        return card["prints"]
+    if not "prints_search_uri" in card:
+        return None
+
+    logging.info('prints: calling scryfall')
+    response = _get_json(card["prints_search_uri"])
+    if response is None:
+        return None
+    return response["data"] if "data" in response else []
+
+
+def _normalize_footer(set_code, collector_number):
     if set_code and collector_number:
-        # try and look up by set_code and collector_number first
         set_code = set_code.casefold()
         collector_number = collector_number.split("/")[0]
-        logging.info(f'set_code: {set_code}')
-        logging.info(f'collector_number: {collector_number}')
-        if len(set_code) in range(1, 4) and len(collector_number) in range(1, 4) and \
-                set_code.isalnum() and collector_number.isdigit():
-            url = f'https://api.scryfall.com/cards/{set_code}/{collector_number}'
-            logging.info(f'GET {url}')
-            response = requests.get(url)
-            logging.info(f'response.status = {response.status_code}')
-            if response.status_code == 200:
-                card = response.json()
-                if "name" in card and card["name"] == title:
-                    return True, f'{title} ({set_code}) {collector_number}'
+    return set_code, collector_number
+
+
+def _is_exact_key(set_code, collector_number):
+    return bool(set_code and collector_number) and \
+        len(set_code) in range(1, 4) and len(collector_number) in range(1, 4) and \
+        set_code.isalnum() and collector_number.isdigit()
+
 
+def _exact_match(card, title, set_code, collector_number):
+    # the (match, card) when the printing found by set and number is the card read.
+    # No title at all (e.g. a fingerprint reference named SET_NUMBER) takes the
+    # printing's name.
+    if card is None or "name" not in card:
+        return None
+    if not title:
+        title = card["name"]
+    elif card["name"] != title:
+        return None
+    return True, f'{title} ({set_code}) {collector_number}'
+
+
+def _canonicalize_fuzzy(title, set_code, collector_number):
     # didn't find an exact match via set code and collector number
-    url = f'https://api.scryfall.com/cards/named?fuzzy={quote_plus(title)}'
-    logging.info(f'fuzzy: GET {url}')
-    response = requests.get(url)
-    logging.info(f'response.status = {response.status_code}')
-    if response.status_code != 200:
+    if not title:
+        # nothing to look up by name
+        return False, title
+    card = _lookup_fuzzy(title)
+    if card is None:
         return False, title
-    card = response.json()
     if not "name" in card:
         return False, title
     title = card["name"]
 
-    if not "prints_search_uri" in card or set_code is None or collector_number is None:
+    if set_code is None or collector_number is None:
         return "fuzzy-title", title
 
-    logging.info(f'prints: GET {card["prints_search_uri"]}')
-    response = requests.get(card["prints_search_uri"])
-    logging.info(f'response.status = {response.status_code}')
-    if response.status_code != 200:
+    data = _lookup_prints(card)
+    if data is None:
         return "fuzzy-title", title
 
-    json = response.json()
-    data = json["data"] if "data" in json else None
-
     candidate = None
     for card in data:
         if "set" in card and card["set"].casefold() == set_code:
@@ -59,3 +232,61 @@ def canonicalizeCard(title, set_code=None, collector_number=None):
 
     return "fuzzy-title", title
 
+
+def canonicalizeCard(title, set_code=None, collector_number=None):
+    logging.info("canonicalizing")
+    set_code, collector_number = _normalize_footer(set_code, collector_number)
+    if _is_exact_key(set_code, collector_number):
+        # try and look up by set_code and collector_number first
+        logging.info(f'set_code: {set_code}')
+        logging.info(f'collector_number: {collector_number}')
+        result = _exact_match(_lookup_set_number(set_code, collector_number), title, set_code, collector_number)
+        if result is not None:
+            return result
+
+    return _canonicalize_fuzzy(title, set_code, collector_number)
+
+
+def _map(fn, records, workers):
+    records = list(records)
+    if workers <= 1 or len(records) <= 1:
+        return [fn(*record) for record in records]
+    # the lookups count towards the profile of the batch being canonicalized, if any
+    fn = profiling.carry(fn)
+    with ThreadPoolExecutor(max_workers=min(workers, len(records))) as executor:
+        return list(executor.map(lambda record: fn(*record), records))
+
+
+def canonicalize_batch(records, workers=_default_workers):
+    # records is a sequence of (title, set_code, collector_number), the results of
+    # canonicalizeCard for each come back in the same order. Every exact (set,
+    # number) lookup the catalog and cache can't answer goes out in POST
+    # /cards/collection calls, only the records that miss there fall back to fuzzy
+    # name resolution, on a thread pool so that their round trips overlap
+    records = [(title,) + _normalize_footer(set_code, collector_number)
+        for title, set_code, collector_number in records]
+    results = [None] * len(records)
+    cards = {}
+    wanted = []
+    for title, set_code, collector_number in records:
+        if not _is_exact_key(set_code, collector_number):
+            continue
+        key = (set_code, collector_number)
+        if key in cards:
+            continue
+        cards[key] = _known_set_number(*key)
+        if cards[key] is None:
+            wanted.append(key)
+    if wanted:
+        cards.update(_lookup_collection(wanted))
+
+    misses = []
+    for i, (title, set_code, collector_number) in enumerate(records):
+        results[i] = _exact_match(cards.get((set_code, collector_number)), title, set_code, collector_number)
+        if results[i] is None:
+            misses.append(i)
+    logging.info(f'batch of {len(records)}: {len(wanted)} collection lookups, {len(misses)} fuzzy')
+
+    for i, result in zip(misses, _map(_canonicalize_fuzzy, [records[i] for i in misses], workers)):
+        results[i] = result
+    return results
@@ -0,0 +1,227 @@
+from concurrent.futures import ProcessPoolExecutor
+import functools
+import http.server
+import json
+import logging
+import os
+import socketserver
+import stat
+import threading
+from urllib.parse import parse_qs, urlsplit
+
+from mtg_scanner import recognize
+from mtg_scanner.scryfall import canonicalize_batch
+
+# mtg-scan serve: the OCR engine, caches, catalog and worker processes are set up
+# once and every request reuses them, so a request only pays for recognition.
+#
+#   POST /recognize   body is an image file (any content type but json, ?name= names
+#                     it in the results) or json {"images": [path, ...]} of files the
+#                     server can read. ?profile=1 adds stage timings per image,
+#                     ?canonicalize=0 skips the Scryfall lookups.
+#   GET /health
+#
+# Both answer json, /recognize with {"results": [...]} in the order the images came.
+
+# largest request body accepted
+_max_body = 256 * 1024 * 1024
+
+
+class Recognizer:
+    def __init__(self, options, min_dpi, jobs=1, http_workers=8):
+        # options are recognize_image's
+        self.options = options
+        self.min_dpi = min_dpi
+        self.http_workers = http_workers
+        self.recognized = 0
+        # in process recognition takes one image at a time (the prep buffers are
+        # shared), and guards the count of images recognized
+        self._lock = threading.Lock()
+        self._executor = None
+        recognize.warm_up(**options)
+        if jobs > 1:
+            self._executor = ProcessPoolExecutor(max_workers=jobs, initializer=recognize.init_worker,
+                initargs=(logging.getLogger().level, options))
+            # start the workers (and load their engines) now rather than on the first request
+            for future in [self._executor.submit(os.getpid) for _ in range(jobs)]:
+                future.result()
+
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown()
+
+
+    @staticmethod
+    def _failed(name, e):
+        # an image the recognizer didn't get as far as reading, the rest of the request goes on
+        logging.warning(f'recognizing {name} failed', exc_info=e)
+        return recognize.Recognized(name, None, None, None, f'Unable to recognize <{name}>: {e}')
+
+
+    def _run(self, calls):
+        # calls is a list of (image name, call)
+        results = []
+        if self._executor is not None:
+            futures = [(name, self._executor.submit(call)) for name, call in calls]
+            for name, future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    results.append(self._failed(name, e))
+            return results
+        for name, call in calls:
+            with self._lock:
+                try:
+                    results.append(call())
+                except Exception as e:
+                    results.append(self._failed(name, e))
+        return results
+
+
+    def recognize(self, paths=(), uploads=(), profile=False, canonicalize=True):
+        options = dict(self.options, profile=profile)
+        calls = [(fn, functools.partial(recognize.recognize_file, fn, min_dpi=self.min_dpi, **options))
+            for fn in paths]
+        calls += [(upload[0], functools.partial(recognize.recognize_bytes, upload, **options)) for upload in uploads]
+        recognized = self._run(calls)
+        with self._lock:
+            self.recognized += len(recognized)
+
+        canonical = {}
+        if canonicalize:
+            found = [i for i, r in enumerate(recognized) if not r.error]
+            results = canonicalize_batch([(recognized[i].title, recognized[i].set_code,
+                recognized[i].collector_number) for i in found], workers=self.http_workers) if found else []
+            canonical = dict(zip(found, results))
+
+        records = []
+        for i, r in enumerate(recognized):
+            record = {"image": r.image, "title": r.title, "set_code": r.set_code,
+                "collector_number": r.collector_number, "error": r.error}
+            if i in canonical:
+                record["match"], record["card"] = canonical[i]
+            if r.profile is not None:
+                record["profile"] = r.profile.to_json()
+            records.append(record)
+        return {"results": records}
+
+
+def _flag(query, name, default):
+    values = query.get(name)
+    if not values:
+        return default
+    return values[-1].lower() not in ('0', 'false', 'no', '')
+
+
+class _Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+
+
+    def address_string(self):
+        # clients of a unix socket don't have an address
+        if isinstance(self.client_address, tuple) and self.client_address:
+            return self.client_address[0]
+        return 'unix'
+
+
+    def log_message(self, format, *args):
+        logging.info(f'{self.address_string()} {format % args}')
+
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode('utf-8')
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+
+    def do_GET(self):
+        if urlsplit(self.path).path != '/health':
+            self._reply(404, {"error": f'Unknown path <{self.path}>'})
+            return
+        self._reply(200, {"status": "ok", "recognized": self.server.recognizer.recognized})
+
+
+    def do_POST(self):
+        url = urlsplit(self.path)
+        if url.path != '/recognize':
+            self._reply(404, {"error": f'Unknown path <{self.path}>'})
+            return
+        try:
+            length = int(self.headers.get('Content-Length', ''))
+        except ValueError:
+            self._reply(411, {"error": 'Content-Length is required'})
+            return
+        if length > _max_body:
+            self.close_connection = True
+            self._reply(413, {"error": f'Request body over {_max_body} bytes'})
+            return
+        body = self.rfile.read(length)
+        query = parse_qs(url.query)
+
+        paths, uploads = [], []
+        if self.headers.get_content_type() == 'application/json':
+            try:
+                paths = json.loads(body)["images"]
+                if not isinstance(paths, list) or not all(isinstance(fn, str) for fn in paths):
+                    raise TypeError('images is not a list of paths')
+            except (ValueError, KeyError, TypeError) as e:
+                self._reply(400, {"error": f'Expected {{"images": [path, ...]}}: {e}'})
+                return
+        elif body:
+            uploads = [(query.get('name', ['upload'])[-1], body)]
+        else:
+            self._reply(400, {"error": 'No image in the request'})
+            return
+
+        try:
+            result = self.server.recognizer.recognize(paths, uploads,
+                profile=_flag(query, 'profile', False), canonicalize=_flag(query, 'canonicalize', True))
+        except Exception as e:
+            logging.warning('request failed', exc_info=True)
+            self._reply(500, {"error": str(e)})
+            return
+        self._reply(200, result)
+
+
+class _TCPServer(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+
+class _UnixServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+
+def _remove_stale_socket(path):
+    # left behind by a server that didn't shut down cleanly, anything else is left alone
+    try:
+        if stat.S_ISSOCK(os.stat(path).st_mode):
+            os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def make_server(recognizer, host='127.0.0.1', port=8765, unix_socket=None):
+    if unix_socket:
+        _remove_stale_socket(unix_socket)
+        server = _UnixServer(unix_socket, _Handler)
+    else:
+        server = _TCPServer((host, port), _Handler)
+    server.recognizer = recognizer
+    return server
+
+
+def serve(recognizer, host='127.0.0.1', port=8765, unix_socket=None):
+    server = make_server(recognizer, host, port, unix_socket)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        recognizer.close()
+        if unix_socket:
+            _remove_stale_socket(unix_socket)
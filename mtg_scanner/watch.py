@@ -0,0 +1,54 @@
+import logging
+import os
+import time
+
+_image_extensions = ('.png', '.jpg', '.jpeg', '.tif', '.tiff', '.bmp', '.ppm', '.pgm')
+
+# seconds between looks at the directory
+_poll_interval = 0.2
+# a file is taken once its size and modification time have held this many seconds,
+# scanning software that writes in place is done with it by then
+_settle_time = 0.4
+
+
+def watch_directory(directory, poll_interval=_poll_interval, settle_time=_settle_time):
+    # Yields the path of each image in directory once it's fully written, in the
+    # order they settle, starting with the ones already there. After every look at
+    # the directory it yields None so the caller can deal with what it has while
+    # nothing new is coming. A file replaced under the same name is yielded again.
+    # It never ends, the caller stops pulling from it (e.g. on Ctrl-C).
+    taken = {}          # path -> (size, mtime) it was yielded with, while it's there
+    candidates = {}     # path -> ((size, mtime), when it was first seen that way)
+    while True:
+        now = time.monotonic()
+        ready = []
+        present = set()
+        for entry in os.scandir(directory):
+            if entry.name.startswith('.') or not entry.name.lower().endswith(_image_extensions):
+                continue
+            try:
+                if not entry.is_file():
+                    continue
+                st = entry.stat()
+            except FileNotFoundError:
+                continue    # renamed or removed since the listing
+            present.add(entry.path)
+            signature = (st.st_size, st.st_mtime_ns)
+            if taken.get(entry.path) == signature:
+                continue
+            previous = candidates.get(entry.path)
+            if previous is None or previous[0] != signature:
+                candidates[entry.path] = (signature, now)
+            elif st.st_size > 0 and now - previous[1] >= settle_time:
+                ready.append((st.st_mtime_ns, entry.name, entry.path))
+        for seen in (candidates, taken):
+            for path in list(seen):
+                if path not in present:
+                    del seen[path]
+
+        for _, _, path in sorted(ready):
+            taken[path] = candidates.pop(path)[0]
+            logging.info(f'watch: {path} is ready')
+            yield path
+        yield None
+        time.sleep(poll_interval)
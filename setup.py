@@ -87,10 +87,10 @@ try:
         #
         # Similar to `install_requires` above, these must be valid existing
         # projects.
-        #extras_require={  # Optional
-        #    "dev": ["check-manifest"],
-        #    "test": ["coverage"],
-        #},
+        extras_require={  # Optional
+            # mtg-scan --scanner, python-sane hands pages over as PIL images
+            "scanner": ["python-sane", "Pillow"],
+        },
         # If there are data files included in your packages that need to be
         # installed, specify them here.
         package_data={  # Optional
@@ -112,7 +112,7 @@ try:
         # executes the function `main` from this package when invoked:
         entry_points={  # Optional
             "console_scripts": [
-                "mtg-scan=mtg_scanner:main",
+                "mtg-scan=mtg_scanner.cli:main",
             ],
         },
         # List additional URLs that are relevant to your project as a dict.
@@ -0,0 +1,88 @@
+import threading
+
+from mtg_scanner import cache
+from mtg_scanner.cache import ResponseCache
+
+
+class _Response:
+    def __init__(self, status_code, content=b'', headers=None):
+        self.status_code = status_code
+        self.content = content
+        self.headers = headers or {}
+
+
+class _Fetcher:
+    def __init__(self, *responses):
+        self.responses = list(responses)
+        self.calls = []
+
+
+    def __call__(self, url, headers):
+        self.calls.append((url, headers))
+        return self.responses.pop(0)
+
+
+def test_miss_then_hit(tmp_path):
+    c = ResponseCache(str(tmp_path / 'c.sqlite'))
+    fetch = _Fetcher(_Response(200, b'{"name": "Opt"}'))
+    assert c.get('u', fetch) == (200, b'{"name": "Opt"}')
+    assert c.get('u', fetch) == (200, b'{"name": "Opt"}')
+    assert len(fetch.calls) == 1
+    assert c.stats() == {"hits": 1, "misses": 1, "revalidated": 0}
+
+
+def test_stale_entry_revalidated_with_etag(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    c = ResponseCache(str(tmp_path / 'c.sqlite'), ttl=60)
+    fetch = _Fetcher(_Response(200, b'old', {'ETag': '"v1"', 'Last-Modified': 'yesterday'}),
+        _Response(304))
+    c.get('u', fetch)
+    now[0] += 61
+    assert c.get('u', fetch) == (200, b'old')
+    assert fetch.calls[1][1] == {'If-None-Match': '"v1"', 'If-Modified-Since': 'yesterday'}
+    assert c.stats()["revalidated"] == 1
+    # revalidating made it fresh again
+    now[0] += 30
+    assert c.get('u', fetch) == (200, b'old')
+    assert len(fetch.calls) == 2
+
+
+def test_stale_entry_replaced(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    c = ResponseCache(str(tmp_path / 'c.sqlite'), ttl=60)
+    c.get('u', _Fetcher(_Response(200, b'old')))
+    now[0] += 61
+    assert c.get('u', _Fetcher(_Response(200, b'new'))) == (200, b'new')
+    assert c.peek('u') == (200, b'new')
+
+
+def test_not_found_is_cached_but_errors_are_not(tmp_path):
+    c = ResponseCache(str(tmp_path / 'c.sqlite'))
+    c.get('missing', _Fetcher(_Response(404, b'{}')))
+    assert c.peek('missing') == (404, b'{}')
+    c.get('broken', _Fetcher(_Response(503, b'')))
+    assert c.peek('broken') is None
+
+
+def test_peek_only_returns_fresh_entries(tmp_path, monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(cache.time, 'time', lambda: now[0])
+    c = ResponseCache(str(tmp_path / 'c.sqlite'), ttl=60)
+    assert c.peek('u') is None
+    c.put('u', b'body')
+    assert c.peek('u') == (200, b'body')
+    now[0] += 61
+    assert c.peek('u') is None
+
+
+def test_counters_from_many_threads(tmp_path):
+    c = ResponseCache(str(tmp_path / 'c.sqlite'))
+    c.put('u', b'body')
+    threads = [threading.Thread(target=lambda: [c.peek('u') for _ in range(10)]) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert c.stats()["hits"] == 80
@@ -0,0 +1,25 @@
+from mtg_scanner.card import FooterInfo, parse_footer
+
+
+def test_collector_line():
+    assert parse_footer('123/280 R', 'DMU • EN') == FooterInfo('DMU', '123/280', 'R')
+    assert parse_footer('0123 C', 'DMU • EN') == FooterInfo('DMU', '0123', 'C')
+    # read without the space between the number and the rarity
+    assert parse_footer('199/269M', 'DOM • EN') == FooterInfo('DOM', '199/269', 'M')
+    assert parse_footer('7/264', 'DMU • EN') == FooterInfo('DMU', '7/264', '')
+
+
+def test_language_run_into_the_set_code():
+    assert parse_footer('123/280 R', 'DMUEN') == FooterInfo('DMU', '123/280', 'R')
+    assert parse_footer('156/249 R', 'M10EN') == FooterInfo('M10', '156/249', 'R')
+    assert parse_footer('1/2 C', 'dmufr') == FooterInfo('dmu', '1/2', 'C')
+    # a four letter set code is left alone when no language follows
+    assert parse_footer('12/350 C', 'PLST') == FooterInfo('PLST', '12/350', 'C')
+    assert parse_footer('12/350 C', 'PLST EN') == FooterInfo('PLST', '12/350', 'C')
+
+
+def test_empty_or_garbage_lines():
+    assert parse_footer('', '') == FooterInfo('', '', '')
+    assert parse_footer('~-_.', '• ,') == FooterInfo('', '', '')
+    assert parse_footer('Rare', 'DMU • EN') == FooterInfo('DMU', '', '')
+    assert parse_footer('123/280 R', '') == FooterInfo('', '123/280', 'R')
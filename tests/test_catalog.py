@@ -0,0 +1,26 @@
+import zlib
+
+from mtg_scanner import catalog
+from mtg_scanner.catalog import Catalog
+
+_entries = [('Opt', 'dom', '60'), ('Opt', 'xln', '65'), ("Lim-Dûl's Vault", 'all', '1'), ('Fire // Ice', 'apc', '128')]
+
+
+def _lookups(c):
+    return (c.lookup_name('opt'), c.lookup_name('LIM DUL\'S VAULT'), c.lookup_name('Fire'),
+        c.lookup_set_number('DOM', '60'), [card["set"] for card in c.prints('Opt')])
+
+
+def test_saved_index_loads_the_same_catalog(tmp_path):
+    c = Catalog(list(_entries))
+    c.save(str(tmp_path / 'cards.idx'))
+    loaded = Catalog.load(str(tmp_path / 'cards.idx'))
+    assert loaded.entries == c.entries
+    assert _lookups(loaded) == _lookups(c)
+    assert loaded.lookup_name('fire')["name"] == 'Fire // Ice'
+
+
+def test_version_1_index_still_loads(tmp_path):
+    text = '\n'.join('\t'.join(entry) for entry in _entries)
+    (tmp_path / 'cards.idx').write_bytes(catalog._magic_v1 + zlib.compress(text.encode('utf-8')))
+    assert _lookups(Catalog.load(str(tmp_path / 'cards.idx'))) == _lookups(Catalog(list(_entries)))
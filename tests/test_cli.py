@@ -0,0 +1,28 @@
+from click.testing import CliRunner
+
+from mtg_scanner import cli
+
+
+def test_no_arguments_runs_scan(monkeypatch):
+    scanned = []
+    monkeypatch.setattr(cli, '_setup_scryfall', lambda *args: scanned.append(args))
+    result = CliRunner().invoke(cli.main, [])
+    assert result.exit_code == 0, result.output
+    assert len(scanned) == 1
+
+
+def test_help_lists_the_commands_and_scan_options():
+    result = CliRunner().invoke(cli.main, ['--help'], prog_name='mtg-scan')
+    assert result.exit_code == 0
+    assert 'scan is the default command' in result.output
+    assert 'canonicalize ' in result.output
+    commands, scan_options = result.output.split('Options of scan, the default command:')
+    assert '--journal' in scan_options and '--glyph-bank' in scan_options
+    assert '--help' not in scan_options
+
+
+def test_subcommand_help_is_its_own():
+    result = CliRunner().invoke(cli.main, ['canonicalize', '--help'], prog_name='mtg-scan')
+    assert result.exit_code == 0
+    assert result.output.startswith('Usage: mtg-scan canonicalize')
+    assert 'Options of scan' not in result.output
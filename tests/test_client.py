@@ -0,0 +1,56 @@
+from mtg_scanner import client
+from mtg_scanner import scryfall
+from mtg_scanner.client import ScryfallClient, TokenBucket
+
+
+class _Clock:
+    # times in quarter seconds, exact in binary so a computed wait always moves it on
+    def __init__(self):
+        self.now = 64.0
+        self.slept = []
+
+
+    def monotonic(self):
+        return self.now
+
+
+    def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def test_token_bucket_allows_a_burst_then_the_rate(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(client.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(client.time, 'sleep', clock.sleep)
+    bucket = TokenBucket(rate=4, burst=3)
+    for _ in range(3):
+        bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire()
+    assert clock.slept == [0.25]
+
+
+def test_token_bucket_refills_up_to_the_burst(monkeypatch):
+    clock = _Clock()
+    monkeypatch.setattr(client.time, 'monotonic', clock.monotonic)
+    monkeypatch.setattr(client.time, 'sleep', clock.sleep)
+    bucket = TokenBucket(rate=4, burst=2)
+    bucket.acquire()
+    bucket.acquire()
+    clock.now += 60
+    bucket.acquire()
+    bucket.acquire()
+    assert clock.slept == []
+    bucket.acquire()
+    assert clock.slept
+
+
+def test_unreachable_scryfall_leaves_cards_unresolved(monkeypatch):
+    # nothing listens on the discard port, the batch comes back unresolved instead of raising
+    monkeypatch.setattr(scryfall, '_api_base', 'http://127.0.0.1:9')
+    monkeypatch.setattr(scryfall, '_client', ScryfallClient(retries=0, timeout=2))
+    monkeypatch.setattr(scryfall, '_cache', None)
+    monkeypatch.setattr(scryfall, '_catalog', None)
+    results = scryfall.canonicalize_batch([('Opt', 'dom', '60'), ('Shivan Dragon', None, None)], workers=1)
+    assert results == [(False, 'Opt'), (False, 'Shivan Dragon')]
@@ -0,0 +1,48 @@
+from mtg_scanner import scryfall
+from mtg_scanner.fuzzy import NameMatcher, ocr_fold
+
+_names = ['Muldrotha, the Gravetide', 'Llanowar Elves', 'Shivan Dragon', 'Birds of Paradise',
+    'Dark Ritual', 'Lightning Bolt', 'Counterspell', 'Serra Angel', 'Giant Growth',
+    'Jace, the Mind Sculptor', 'Wrath of God', 'Opt', 'Mox Opal', 'Elvish Mystic']
+
+
+def _best(matcher, title):
+    matches = matcher.match(title, limit=1)
+    return matches[0] if matches else (None, 0)
+
+
+def test_ocr_confusions_fold_to_the_same_key():
+    assert ocr_fold('Muldrotha') == ocr_fold('Mulclrotha')
+    assert ocr_fold('Elvish Mystic') == ocr_fold('EIvish Mystic') == ocr_fold('E1vish Mystic')
+    assert ocr_fold('Mox Opal') == ocr_fold('M0x 0pal')
+    assert ocr_fold('Wrath of God') == ocr_fold('Wrath of Gocl')
+    assert ocr_fold('Serra Angel') != ocr_fold('Serra Angle')
+
+
+def test_confused_reads_match_exactly():
+    matcher = NameMatcher(_names)
+    for title, name in [('Rnox Opal', 'Mox Opal'), ('EIvish Rnystic', 'Elvish Mystic'),
+            ('Birds of Paraclise', 'Birds of Paradise'), ('LIanowar EIves', 'Llanowar Elves'), ('Lightning 8olt', 'Lightning Bolt'),
+            ('M0X 0PAL', 'Mox Opal'), ('Giant Grovvth', 'Giant Growth')]:
+        assert _best(matcher, title) == (name, 1.0), title
+
+
+def test_clipped_titles():
+    matcher = NameMatcher(_names)
+    name, score = _best(matcher, 'uldrotha, the Gravet')
+    assert name == 'Muldrotha, the Gravetide' and score >= scryfall._min_fuzzy_score
+    name, score = _best(matcher, 'Jace, the Mind Sculpt')
+    assert name == 'Jace, the Mind Sculptor' and score >= scryfall._min_fuzzy_score
+    # the less of the name is left the less sure the match
+    assert _best(matcher, 'Jace, the Mi')[1] < score
+
+
+def test_rejected_queries():
+    matcher = NameMatcher(_names)
+    assert _best(matcher, 'Counterfeit Spellbomb')[1] < scryfall._min_fuzzy_score
+    assert _best(matcher, 'Shivan Wurm')[1] < scryfall._min_fuzzy_score
+    assert _best(matcher, 'Lightning Dragon')[1] < scryfall._min_fuzzy_score
+    assert _best(matcher, 'Dark Confidant')[1] < scryfall._min_fuzzy_score
+    assert matcher.match('~~~') == []
+    assert matcher.match('') == []
+    assert NameMatcher([]).match('Opt') == []
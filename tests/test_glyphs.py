@@ -0,0 +1,57 @@
+import os
+import sys
+
+import cv2
+import numpy
+
+from mtg_scanner import card
+from mtg_scanner import glyphs
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from synthetic import CARDS, render_card
+
+
+def _footer_lines(truth, dpi, noise=0, rng=None):
+    # the two prepped footer lines of a synthetic card and what they say
+    title, set_code, collector_number, set_size, rarity = truth
+    c = card.StraightCard(render_card(truth, dpi, noise, rng), card_type=None, save_debug_images=False, ocr=None)
+    return [(c._extract_and_prep_line('glyphs', 140, rect, invert=True).copy(), text) for rect, text in (
+        (card.FOOTER_LINE1_SECTION_RECT, f'{collector_number}/{set_size} {rarity}'),
+        (card.FOOTER_LINE2_SECTION_RECT, f'{set_code.upper()} EN'))]
+
+
+def _bank(tmp_path):
+    with open(tmp_path / 'labels.tsv', 'w', encoding='utf-8') as labels:
+        for truth in CARDS:
+            for i, (img, text) in enumerate(_footer_lines(truth, 600)):
+                fn = f'{truth[1]}_{truth[2]}_{i}.png'
+                cv2.imwrite(str(tmp_path / fn), img)
+                labels.write(f'{fn}\t{text}\n')
+    return glyphs.GlyphBank.build(str(tmp_path / 'labels.tsv'))
+
+
+def test_segment_cuts_a_cell_per_character():
+    for truth in CARDS:
+        for img, text in _footer_lines(truth, 600):
+            cells, spaces = glyphs.segment(img)
+            assert cells.shape == (len(text.replace(' ', '')), glyphs._cell_pixels)
+            assert len(spaces) == len(cells) and not spaces[0]
+            assert cells.min() >= 0 and cells.max() <= 1
+
+
+def test_reads_back_what_the_bank_was_built_from(tmp_path):
+    bank = _bank(tmp_path)
+    assert set(bank.labels) == set(''.join(f'{t[2]}/{t[3]}{t[4]}{t[1].upper()}EN' for t in CARDS))
+    bank.save(str(tmp_path / 'glyphs.npz'))
+    bank = glyphs.GlyphBank.load(str(tmp_path / 'glyphs.npz'))
+    rng = numpy.random.default_rng(0)
+    for truth in CARDS:
+        lines = _footer_lines(truth, 600, noise=8, rng=rng)
+        for img, text in lines:
+            labels, distances, margins = bank.classify(glyphs.segment(img)[0])
+            assert ''.join(labels) == text.replace(' ', '')
+        footer = card.parse_footer(*(bank.read_line(img) for img, _ in lines))
+        assert (footer.set_code.casefold(), footer.collector_number, footer.rarity) == \
+            (truth[1], f'{truth[2]}/{truth[3]}', truth[4])
+    assert bank.read_line(numpy.full((185, 928), 255, numpy.uint8)) is None
@@ -0,0 +1,64 @@
+import json
+
+from click.testing import CliRunner
+
+from mtg_scanner import cli
+from mtg_scanner import journal
+from mtg_scanner import scryfall
+
+
+def _entry(digest, title, match, card, image='a.jpg'):
+    return {"sha256": digest, "image": image, "title": title, "set_code": 'dom', "collector_number": '60',
+        "match": match, "card": card, "time": 0}
+
+
+def test_later_lines_win_and_a_cut_short_line_is_skipped(tmp_path):
+    fn = tmp_path / 'journal.jsonl'
+    fn.write_text(json.dumps(_entry('a', 'Opt', False, 'x')) + '\n' +
+        json.dumps(_entry('b', 'Shivan Dragon', True, 'Shivan Dragon (m10) 156')) + '\n' +
+        json.dumps(_entry('a', 'Opt', True, 'Opt (dom) 60')) + '\n' +
+        json.dumps(_entry('c', 'Serra Angel', True, 'y'))[:40], encoding='utf-8')
+    j = journal.Journal(str(fn))
+    assert sorted(j.entries) == ['a', 'b']
+    assert j.get('a')["card"] == 'Opt (dom) 60'
+    assert j.get('c') is None
+    # the next record starts on a line of its own
+    j.record('c', 'c.jpg', ('Serra Angel', 'dom', '33'), (True, 'Serra Angel (dom) 33'))
+    j.close()
+    j = journal.Journal(str(fn))
+    assert sorted(j.entries) == ['a', 'b', 'c']
+    assert j.get('c')["card"] == 'Serra Angel (dom) 33'
+    j.close()
+
+
+def test_is_resolved():
+    assert journal.is_resolved(_entry('a', 'Opt', True, 'Opt (dom) 60'))
+    assert journal.is_resolved(_entry('a', 'Opt', 'fuzzy-title-set', 'Opt (dom) 60'))
+    assert not journal.is_resolved(_entry('a', 'Opt', 'fuzzy-title', 'Opt (xln) 65'))
+    assert not journal.is_resolved(_entry('a', 'Opt', False, 'Opt'))
+
+
+def test_resume_canonicalizes_only_the_unresolved(tmp_path, monkeypatch):
+    images = []
+    for name in ('resolved.jpg', 'fuzzy.jpg'):
+        (tmp_path / name).write_bytes(name.encode())
+        images.append(str(tmp_path / name))
+    fn = tmp_path / 'journal.jsonl'
+    fn.write_text(json.dumps(_entry(journal.file_digest(images[0]), 'Opt', True, 'Opt (dom) 60')) + '\n' +
+        json.dumps(_entry(journal.file_digest(images[1]), 'Shivan Dragon', 'fuzzy-title', 'Shivan Dragon (m19) 1')) +
+        '\n', encoding='utf-8')
+    batches = []
+
+    def canonicalize_batch(records, workers):
+        batches.append(records)
+        return [(True, 'Shivan Dragon (dom) 60') for _ in records]
+
+    monkeypatch.setattr(scryfall, 'canonicalize_batch', canonicalize_batch)
+    monkeypatch.setattr(cli, '_setup_scryfall', lambda *args: None)
+    result = CliRunner().invoke(cli.main, ['scan', *images, '--journal', str(fn), '--resume'])
+    assert result.exit_code == 0, result.output
+    assert result.output.splitlines() == ['Opt (dom) 60', 'Shivan Dragon (dom) 60']
+    assert batches == [[('Shivan Dragon', 'dom', '60')]]
+    j = journal.Journal(str(fn))
+    assert j.get(journal.file_digest(images[1]))["match"] is True
+    j.close()
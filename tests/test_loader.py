@@ -0,0 +1,32 @@
+import cv2
+import numpy
+
+from mtg_scanner import loader
+
+
+def _write(path, data):
+    path.write_bytes(data)
+    return str(path)
+
+
+def test_truncated_jpeg_headers_read_as_no_image(tmp_path):
+    # cut off in a segment length, then in the SOF frame's size
+    for data in (b'\xff\xd8\xff\xe0\x00', b'\xff\xd8\xff\xc0\x00\x11\x08\x01'):
+        assert loader.load_card_image(_write(tmp_path / 'card.jpg', data)) is None
+
+
+def test_garbage_pnm_header_reads_as_no_image(tmp_path):
+    assert loader.load_card_image(_write(tmp_path / 'card.ppm', b'P6\nfoo bar 255\n')) is None
+
+
+def test_jpeg_decodes(tmp_path):
+    img = numpy.full((88, 63, 3), 128, numpy.uint8)
+    ok, data = cv2.imencode('.jpg', img)
+    assert ok
+    assert loader.load_card_image(_write(tmp_path / 'card.jpg', data.tobytes())).shape == img.shape
+
+
+def test_pnm_is_mapped(tmp_path):
+    img = numpy.arange(4 * 3 * 3, dtype=numpy.uint8).reshape(4, 3, 3)
+    fn = _write(tmp_path / 'card.ppm', b'P6\n# a comment\n3 4\n255\n' + img[:, :, ::-1].tobytes())
+    assert (loader.load_card_image(fn) == img).all()
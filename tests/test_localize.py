@@ -0,0 +1,57 @@
+import cv2
+import numpy
+
+from mtg_scanner import localize
+
+_dpi = 600
+_px_per_mm = _dpi / 25.4
+
+
+def _mm(value):
+    return int(round(value * _px_per_mm))
+
+
+def _card(frame=230):
+    # a full-bleed card: 3 mm black border, a light frame and a darker art box
+    img = numpy.full((_mm(localize.MM_CARD_HEIGHT), _mm(localize.MM_CARD_WIDTH), 3), 20, numpy.uint8)
+    img[_mm(3):-_mm(3), _mm(3):-_mm(3)] = frame
+    img[_mm(11):_mm(49), _mm(5):-_mm(5)] = (90, 120, 60)
+    img[_mm(52):_mm(78), _mm(5):-_mm(5)] = 200
+    return img
+
+
+def _on_background(card, margin_mm=12, angle=0, background=245):
+    h, w = card.shape[:2]
+    margin = _mm(margin_mm)
+    canvas = numpy.full((h + 2 * margin, w + 2 * margin, 3), background, numpy.uint8)
+    canvas[margin:margin + h, margin:margin + w] = card
+    corners = numpy.array([[0, 0], [w, 0], [w, h], [0, h]], numpy.float64) + margin
+    if angle:
+        rotation = cv2.getRotationMatrix2D((canvas.shape[1] / 2, canvas.shape[0] / 2), angle, 1)
+        canvas = cv2.warpAffine(canvas, rotation, canvas.shape[1::-1], borderValue=(background,) * 3)
+        corners = cv2.transform(corners[None], rotation)[0]
+    return canvas, corners
+
+
+def test_full_bleed_card_fills_the_scan():
+    assert localize.find_card_quad(_card()) is None
+
+
+def test_light_inner_frame_is_not_taken_for_the_card():
+    for frame in (255, 230, 190):
+        assert localize.find_card_quad(_card(frame)) is None
+
+
+def test_card_on_the_scanner_background_is_found():
+    scan, corners = _on_background(_card())
+    quad = localize.find_card_quad(scan)
+    assert quad is not None
+    assert numpy.abs(quad - corners).max() < _mm(1)
+
+
+def test_tilted_card_is_found():
+    for angle in (-4, 3):
+        scan, corners = _on_background(_card(), angle=angle)
+        quad = localize.find_card_quad(scan)
+        assert quad is not None
+        assert numpy.abs(quad - corners).max() < _mm(1)
@@ -0,0 +1,60 @@
+import sqlite3
+
+import numpy
+
+from mtg_scanner import ocrcache
+
+
+def _keys(n, seed=0):
+    return numpy.random.default_rng(seed).integers(0, 256, (n, 256), dtype=numpy.uint8)
+
+
+def test_lookups_past_the_initial_capacity(tmp_path):
+    fn = str(tmp_path / 'ocr.sqlite')
+    keys = _keys(ocrcache._initial_rows * 3)
+    cache = ocrcache.OcrCache('test', 1, fn)
+    for i, key in enumerate(keys):
+        cache.put('title', key, {"n": i})
+    assert [cache.get('title', key)["n"] for key in keys[::37]] == list(range(len(keys)))[::37]
+    assert cache.get('title', _keys(1, seed=1)[0]) is None
+    assert cache.get('footer', keys[0]) is None
+    cache.close()
+
+    cache = ocrcache.OcrCache('test', 1, fn)
+    assert cache.get('title', keys[-1]) == {"n": len(keys) - 1}
+    assert ocrcache.OcrCache('test', 2, fn).get('title', keys[-1]) is None
+
+
+def test_access_times_are_written_in_batches(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocrcache, '_touch_batch', 3)
+    fn = str(tmp_path / 'ocr.sqlite')
+    keys = _keys(4)
+    cache = ocrcache.OcrCache('test', 1, fn)
+    for i, key in enumerate(keys):
+        cache.put('title', key, i)
+    stored = dict(sqlite3.connect(fn).execute('SELECT value, accessed_at FROM results'))
+
+    def accessed():
+        return dict(sqlite3.connect(fn).execute('SELECT value, accessed_at FROM results'))
+
+    cache.get('title', keys[0])
+    cache.get('title', keys[1])
+    assert accessed() == stored
+    cache.get('title', keys[2])
+    assert [accessed()[str(i)] > stored[str(i)] for i in range(4)] == [True, True, True, False]
+    cache.get('title', keys[3])
+    cache.close()
+    assert accessed()['3'] > stored['3']
+
+
+def test_eviction_keeps_the_recently_read(tmp_path, monkeypatch):
+    monkeypatch.setattr(ocrcache, '_evict_interval', 10)
+    fn = str(tmp_path / 'ocr.sqlite')
+    keys = _keys(10)
+    cache = ocrcache.OcrCache('test', 1, fn, max_entries=5)
+    for i, key in enumerate(keys[:9]):
+        cache.put('title', key, i)
+    for key in keys[:4]:
+        cache.get('title', key)
+    cache.put('title', keys[9], 9)
+    assert [i for i, key in enumerate(keys) if cache.get('title', key) is not None] == [0, 1, 2, 3, 9]
@@ -0,0 +1,35 @@
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+from mtg_scanner import profiling
+
+
+def test_threads_record_their_own_profiles():
+    barrier = threading.Barrier(2)
+    profiles = {}
+
+    def recognize(name, n):
+        with profiling.recording(profiling.Profile(image=name)) as p:
+            # both profiles are current at once, each thread counts to its own
+            barrier.wait()
+            for _ in range(n):
+                profiling.incr('reads')
+            barrier.wait()
+        profiles[name] = p
+
+    threads = [threading.Thread(target=recognize, args=(name, n)) for name, n in (('a', 3), ('b', 5))]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert profiles['a'].counters == {'reads': 3}
+    assert profiles['b'].counters == {'reads': 5}
+
+
+def test_carry_takes_the_profile_to_a_pool_thread():
+    with profiling.recording(profiling.Profile(batch=2)) as p:
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(profiling.carry(lambda n: profiling.incr('lookups', n)), [1, 2]))
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            list(executor.map(lambda n: profiling.incr('lookups', n), [10]))
+    assert p.counters == {'lookups': 3}
@@ -0,0 +1,46 @@
+import cv2
+import numpy
+import pytest
+from click.testing import CliRunner
+
+from mtg_scanner import cli
+from mtg_scanner import recognize
+from mtg_scanner import scanner
+from mtg_scanner import scryfall
+
+
+def _feeder(tmp_path, pages, jam=False):
+    # pages that read as cards named after their page, and an unreadable sheet last when jam
+    for i in range(pages):
+        cv2.imwrite(str(tmp_path / f'{i:02d}.png'), numpy.full((8, 6, 3), i, numpy.uint8))
+    if jam:
+        (tmp_path / f'{pages:02d}.png').write_bytes(b'not a png')
+    return f'fake:{tmp_path}'
+
+
+def _recognize_page(page, **options):
+    name, img = page
+    return recognize.Recognized(name, f'Card {int(img[0, 0, 0])}', 'dom', '1', None)
+
+
+def _canonicalize_batch(records, workers):
+    return [(True, title) for title, set_code, collector_number in records]
+
+
+def test_fake_device_scans_in_name_order(tmp_path):
+    pages = list(scanner.scan_pages(scanner.open_device(_feeder(tmp_path, 3))))
+    pages = [page for page in pages if page is not None]
+    assert [name for name, img in pages] == ['scan-0001', 'scan-0002', 'scan-0003']
+    assert [int(img[0, 0, 0]) for name, img in pages] == [0, 1, 2]
+
+
+@pytest.mark.parametrize('jobs', ['1', '2', '4'])
+def test_cards_fed_before_a_jam_are_written_out(tmp_path, monkeypatch, jobs):
+    monkeypatch.setattr(recognize, 'recognize_page', _recognize_page)
+    monkeypatch.setattr(scryfall, 'canonicalize_batch', _canonicalize_batch)
+    result = CliRunner().invoke(cli.main, ['scan', '--scanner', _feeder(tmp_path, 8, jam=True),
+        '--no-cache', '-j', jobs])
+    assert result.exit_code == 1
+    assert 'Scanner stopped after 8 pages' in result.output
+    assert [line for line in result.output.splitlines() if line.startswith('Card')] == \
+        [f'Card {i}' for i in range(8)]
@@ -0,0 +1,35 @@
+from mtg_scanner import scryfall
+from mtg_scanner.catalog import Catalog
+
+
+def _offline(monkeypatch, entries):
+    monkeypatch.setattr(scryfall, '_catalog', Catalog(entries))
+    monkeypatch.setattr(scryfall, '_cache', None)
+
+
+def test_set_number_without_a_title_takes_the_printings_name(monkeypatch):
+    # e.g. a fingerprint match on a reference image named dom_60
+    _offline(monkeypatch, [('Opt', 'dom', '60')])
+    assert scryfall.canonicalize_batch([('', 'DOM', '60')], workers=1) == [(True, 'Opt (dom) 60')]
+    assert scryfall.canonicalizeCard('', 'dom', '60') == (True, 'Opt (dom) 60')
+
+
+def test_no_title_and_no_printing_stays_unresolved(monkeypatch):
+    _offline(monkeypatch, [('Opt', 'dom', '60')])
+    assert scryfall.canonicalize_batch([('', None, None)], workers=1) == [(False, '')]
+
+
+def test_number_missing_from_a_catalog_set_is_looked_up_online(monkeypatch):
+    # the catalog has dom, but not a card added to it after it was downloaded
+    _offline(monkeypatch, [('Opt', 'dom', '60')])
+    asked = []
+
+    def lookup_collection(keys):
+        asked.extend(keys)
+        return {('dom', '270'): {"name": "Firesong and Sunspeaker", "set": "dom", "collector_number": "270"}}
+
+    monkeypatch.setattr(scryfall, '_lookup_collection', lookup_collection)
+    results = scryfall.canonicalize_batch([('Opt', 'dom', '60'), ('Firesong and Sunspeaker', 'dom', '270')],
+        workers=1)
+    assert results == [(True, 'Opt (dom) 60'), (True, 'Firesong and Sunspeaker (dom) 270')]
+    assert asked == [('dom', '270')]
@@ -0,0 +1,72 @@
+import os
+import sys
+
+from mtg_scanner import client
+from mtg_scanner import scryfall
+from mtg_scanner.client import ScryfallClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'benchmarks'))
+
+from scryfall_stub import StubScryfall
+
+_cards = [('Opt', 'dom', '60'), ('Shivan Dragon', 'm10', '156')]
+
+
+def _client(**kwargs):
+    # no jitter in the backoff and no rate limit to speak of
+    kwargs.setdefault('backoff', 0.01)
+    return ScryfallClient(rate=1000, burst=1000, **kwargs)
+
+
+def test_retries_429_and_503(monkeypatch):
+    monkeypatch.setattr(client.random, 'random', lambda: 0)
+    with StubScryfall(_cards) as stub:
+        stub.failures = [(429, {}), (503, {})]
+        c = _client()
+        response = c.get(f'{stub.url}/cards/dom/60')
+        assert response.status_code == 200
+        assert response.json()["name"] == 'Opt'
+        assert stub.requests == 3
+        c.close()
+
+
+def test_gives_up_after_the_retries():
+    with StubScryfall(_cards) as stub:
+        stub.failures = [(503, {})] * 3
+        c = _client(retries=2)
+        assert c.get(f'{stub.url}/cards/dom/60').status_code == 503
+        assert stub.requests == 3
+        c.close()
+
+
+def test_honors_retry_after(monkeypatch):
+    slept = []
+    monkeypatch.setattr(client.time, 'sleep', slept.append)
+    with StubScryfall(_cards) as stub:
+        stub.failures = [(429, {'Retry-After': '2'})]
+        c = _client()
+        assert c.post(f'{stub.url}/cards/collection',
+            json={"identifiers": [{"set": "dom", "collector_number": "60"}]}).status_code == 200
+        assert slept == [2.0]
+        c.close()
+
+
+def test_reuses_the_session_connection():
+    with StubScryfall(_cards) as stub:
+        c = _client()
+        for _ in range(5):
+            assert c.get(f'{stub.url}/cards/m10/156').status_code == 200
+        assert stub.requests == 5
+        assert len(stub.connections) == 1
+        c.close()
+
+
+def test_canonicalize_batch_against_the_stub(monkeypatch):
+    with StubScryfall(_cards) as stub:
+        monkeypatch.setattr(scryfall, '_api_base', stub.url)
+        monkeypatch.setattr(scryfall, '_client', _client())
+        monkeypatch.setattr(scryfall, '_cache', None)
+        monkeypatch.setattr(scryfall, '_catalog', None)
+        stub.failures = [(429, {'Retry-After': '0'})]
+        results = scryfall.canonicalize_batch([('Opt', 'dom', '60'), ('Shivan Dragn', None, None)], workers=1)
+        assert results == [(True, 'Opt (dom) 60'), ('fuzzy-title', 'Shivan Dragon')]